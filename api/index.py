@@ -1,5 +1,9 @@
+import base64
+import io
 import os
 import sys
+import time
+from urllib.parse import urlencode
 
 # Set default environment variables for Vercel if not set
 os.environ.setdefault('USERNAME', 'ananb')
@@ -7,61 +11,141 @@ os.environ.setdefault('PASSWORD', 'MICKKY')
 os.environ.setdefault('SECRET_KEY', 'fallback_secret_key_for_vercel')
 
 # Import the Flask app from app.py
-from app import app
+from app import app, metrics
+
+ADAPTER_DURATION = metrics.histogram('gallery_adapter_duration_seconds',
+                                     'Time spent translating proxy events to WSGI and back',
+                                     buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
 
 # Vercel expects the Flask app to be named 'app'
 # This file serves as the entry point for Vercel serverless functions
 
-def handler(event, context):
-    """
-    Vercel serverless function handler for Flask app.
-    Converts Vercel event format to WSGI environ and back.
-    """
-    # Convert Vercel event to WSGI environ manually
+# Response types that can go back as plain text; everything else is base64-encoded
+TEXT_MIMETYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+
+
+def build_environ(event):
+    """Translate a Vercel/Lambda proxy event into a WSGI environ"""
+    body = event.get('body') or b''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+
+    headers = event.get('headers') or {}
+    params = event.get('multiValueQueryStringParameters') or event.get('queryStringParameters') or {}
+    # PATH_INFO is a "native string": the UTF-8 bytes of the path read as latin-1 (PEP 3333)
+    path = (event.get('path') or '/').encode('utf-8').decode('latin-1')
+
     environ = {
         'REQUEST_METHOD': event.get('httpMethod', 'GET'),
         'SCRIPT_NAME': '',
-        'PATH_INFO': event.get('path', '/'),
-        'QUERY_STRING': event.get('queryStringParameters', {}) and '&'.join([f"{k}={v}" for k, v in event.get('queryStringParameters', {}).items()]) or '',
-        'CONTENT_TYPE': event.get('headers', {}).get('content-type', ''),
-        'CONTENT_LENGTH': str(len(event.get('body', ''))),
+        'PATH_INFO': path,
+        'QUERY_STRING': urlencode(params, doseq=True),
+        'CONTENT_TYPE': '',
+        'CONTENT_LENGTH': str(len(body)),
         'SERVER_NAME': 'localhost',
         'SERVER_PORT': '443',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp', ''),
         'wsgi.version': (1, 0),
         'wsgi.url_scheme': 'https',
-        'wsgi.input': event.get('body', ''),
+        # BytesIO shares the bytes object until something writes to it, so the body is not copied again
+        'wsgi.input': io.BytesIO(body),
         'wsgi.errors': sys.stderr,
         'wsgi.multithread': False,
         'wsgi.multiprocess': False,
         'wsgi.run_once': False,
     }
 
-    # Add headers to environ
-    for header_name, header_value in event.get('headers', {}).items():
-        environ[f'HTTP_{header_name.upper().replace("-", "_")}'] = header_value
+    # Add headers to environ; the body length is recomputed above rather than trusted
+    for header_name, header_value in headers.items():
+        key = header_name.upper().replace('-', '_')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = header_value
+        elif key != 'CONTENT_LENGTH':
+            environ[f'HTTP_{key}'] = header_value
+    if 'HTTP_HOST' in environ:
+        environ['SERVER_NAME'] = environ['HTTP_HOST'].split(':', 1)[0]
+    return environ
+
+
+def is_text(content_type):
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    return mimetype.startswith('text/') or mimetype in TEXT_MIMETYPES
 
-    # Handle the request
+
+def run_wsgi(wsgi_app, event, timings=None):
+    """Call a WSGI app with a proxy event and return the proxy response dict
+
+    If ``timings`` is a dict, the adapter's own share of the time (everything but the app)
+    is stored under 'adapter' and appended to any Server-Timing header.
+    """
+    started = time.perf_counter()
+    environ = build_environ(event)
     response_data = {}
+    chunks = []
 
     def start_response(status, headers, exc_info=None):
+        if exc_info and response_data:
+            raise exc_info[1].with_traceback(exc_info[2])
         response_data['status'] = status
         response_data['headers'] = headers
+        return chunks.append
 
-    # Call the Flask app
-    response_body = app(environ, start_response)
+    # Drain whatever iterable the app returns (generators included) and always close it
+    app_started = time.perf_counter()
+    response_body = wsgi_app(environ, start_response)
+    try:
+        for chunk in response_body:
+            if chunk:
+                chunks.append(chunk)
+    finally:
+        if hasattr(response_body, 'close'):
+            response_body.close()
+    app_finished = time.perf_counter()
+    body = chunks[0] if len(chunks) == 1 else b''.join(chunks)
 
-    # Convert response to Vercel format
-    status_code = int(response_data['status'].split()[0])
-    headers = dict(response_data['headers'])
+    headers = {}
+    multi_value_headers = {}
+    content_type = ''
+    for name, value in response_data['headers']:
+        headers[name] = value
+        multi_value_headers.setdefault(name, []).append(value)
+        if name.lower() == 'content-type':
+            content_type = value
 
-    # Handle response body
-    if isinstance(response_body, list):
-        body = b''.join(response_body).decode('utf-8')
-    else:
-        body = response_body
-
-    return {
-        'statusCode': status_code,
+    response = {
+        'statusCode': int(response_data['status'].split()[0]),
         'headers': headers,
-        'body': body
+        'multiValueHeaders': multi_value_headers,
     }
+    response['body'] = None
+    if is_text(content_type):
+        try:
+            response['body'] = body.decode('utf-8')
+            response['isBase64Encoded'] = False
+        except UnicodeDecodeError:
+            pass
+    if response['body'] is None:
+        response['body'] = base64.b64encode(body).decode('ascii')
+        response['isBase64Encoded'] = True
+
+    if timings is not None:
+        timings['adapter'] = (app_started - started) + (time.perf_counter() - app_finished)
+        if 'Server-Timing' in headers:
+            entry = f"adapter;dur={timings['adapter'] * 1000:.2f}"
+            headers['Server-Timing'] = f"{headers['Server-Timing']}, {entry}"
+            multi_value_headers['Server-Timing'] = [headers['Server-Timing']]
+    return response
+
+
+def handler(event, context):
+    """
+    Vercel serverless function handler for Flask app.
+    Converts Vercel event format to WSGI environ and back.
+    """
+    timings = {}
+    response = run_wsgi(app, event, timings)
+    ADAPTER_DURATION.observe(timings['adapter'])
+    return response
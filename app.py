@@ -1,13 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, send_file, g, \
+    has_request_context, before_render_template, template_rendered
 import os
+import hashlib
+import hmac
+import io
+import json
+import multiprocessing
 import uuid
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-from functools import wraps
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
+from operator import attrgetter
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from manifest import MediaManifest, ManifestSync
+from jobs import JobQueue
+from media import MediaItem
+from derivatives import CloudinaryDerivatives, OriginalDerivatives
+from export import ExportEntry, archive_names, stream_zip
+from metrics import Registry, TimedModule
 
 # Load environment variables
 load_dotenv()
@@ -15,24 +32,356 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'fallback_secret_key')
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+# Per-process metrics, served in the Prometheus text format at /metrics
+metrics = Registry()
+REQUEST_DURATION = metrics.histogram('gallery_http_request_duration_seconds', 'Time spent handling a request',
+                                     ('method', 'endpoint', 'status'))
+REQUEST_ERRORS = metrics.counter('gallery_http_request_errors_total', 'Requests answered with a 5xx', ('endpoint',))
+STORAGE_DURATION = metrics.histogram('gallery_storage_call_duration_seconds', 'Time spent in storage SDK calls',
+                                     ('call',))
+STORAGE_ERRORS = metrics.counter('gallery_storage_call_errors_total', 'Storage SDK calls that raised', ('call',))
+RENDER_DURATION = metrics.histogram('gallery_template_render_duration_seconds', 'Time spent rendering templates',
+                                    ('template',))
+UPLOAD_BYTES = metrics.counter('gallery_upload_bytes_total', 'Bytes of media stored', ('path',))
+STORAGE_RETRIES = metrics.counter('gallery_storage_retries_total', 'Storage calls retried after a transient error',
+                                  ('call',))
+RATE_LIMIT_REMAINING = metrics.gauge('gallery_storage_rate_limit_remaining',
+                                     'Admin API calls left in the current quota window, as last reported')
+CIRCUIT_OPEN = metrics.gauge('gallery_storage_circuit_open', '1 while calls to a storage API are paused',
+                             ('api',))
+
+# Bearer token for scrapers; without one, /metrics needs a logged-in session
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+def server_timing(name, seconds, description=None):
+    """Add an entry to this request's Server-Timing header (no-op outside a request)"""
+    if has_request_context():
+        g.setdefault('server_timing', []).append((name, seconds, description))
+
+def record_storage_call(label, seconds, error):
+    STORAGE_DURATION.observe(seconds, call=label)
+    if error is not None:
+        STORAGE_ERRORS.inc(call=label)
+    server_timing('storage', seconds, label)
+
+_cloudinary = None
+
+def record_storage_retry(label, error):
+    STORAGE_RETRIES.inc(call=label)
+    print(f'Retrying {label} after: {error}')
+
+def cloudinary_sdk():
+    """The shared StorageClient, created on first use to keep the SDK import off the cold-start path
+
+    Pool size, retries and the Admin API quota floor come from STORAGE_POOL_SIZE,
+    STORAGE_MAX_RETRIES, STORAGE_BACKOFF and STORAGE_QUOTA_FLOOR (see storage.py).
+    """
+    global _cloudinary
+    if _cloudinary is None:
+        from storage import StorageClient
+        # Every attempt is timed, so retries show up in the storage metrics and Server-Timing
+        _cloudinary = StorageClient.from_env(on_call=record_storage_call, on_retry=record_storage_retry)
+    return _cloudinary
+
+_storage = None
+
+def storage_backend():
+    """The configured StorageBackend, created on first use like the SDK client"""
+    global _storage
+    if _storage is None:
+        import backends
+        if STORAGE_BACKEND == 'cloudinary':
+            # StorageClient already times each SDK call
+            _storage = backends.CloudinaryBackend(cloudinary_sdk(), derivatives, LARGE_UPLOAD_THRESHOLD,
+                                                  UPLOAD_CHUNK_SIZE)
+        else:
+            backend = (backends.LocalBackend(LOCAL_STORAGE_PATH, LOCAL_STORAGE_URL) if STORAGE_BACKEND == 'local'
+                       else backends.S3Backend.from_env())
+            _storage = TimedModule(backend, backend.name, record_storage_call)
+    return _storage
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi', 'mkv'}
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv'}
+
+# Request bodies above this size are rejected with 413 before anything is read
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 4 * 1024 ** 3))
+
+# Files above the threshold go to Cloudinary in UPLOAD_CHUNK_SIZE pieces via the chunked upload API
+LARGE_UPLOAD_THRESHOLD = int(os.getenv('LARGE_UPLOAD_THRESHOLD', 20 * 1024 ** 2))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 20 * 1024 ** 2))
 
-# Password configuration from environment variables
+# Password configuration from environment variables. PASSWORD_HASH (from
+# werkzeug's generate_password_hash) skips hashing on startup; otherwise the plain
+# PASSWORD is hashed on the first login attempt rather than at import time.
 USERNAME = os.getenv('USERNAME')
 PASSWORD = os.getenv('PASSWORD')
+PASSWORD_HASH = os.getenv('PASSWORD_HASH')
+
+if not USERNAME or not (PASSWORD or PASSWORD_HASH):
+    raise ValueError("USERNAME and PASSWORD (or PASSWORD_HASH) must be set in environment variables")
+
+def password_hash():
+    global PASSWORD_HASH
+    if PASSWORD_HASH is None:
+        PASSWORD_HASH = generate_password_hash(PASSWORD)
+    return PASSWORD_HASH
+
+# Cloudinary notifications posted to /hooks/cloudinary keep the manifest current. Turn this on
+# once the notification URL is set in the Cloudinary console; full re-listing then only runs
+# as an occasional repair.
+CLOUDINARY_WEBHOOKS = os.getenv('CLOUDINARY_WEBHOOKS', 'false').lower() in ('1', 'true', 'yes')
+# Notifications older than this are refused, so a captured request cannot be replayed later
+WEBHOOK_MAX_AGE = int(os.getenv('WEBHOOK_MAX_AGE', 7200))
+
+# Local media manifest so the gallery is served without an Admin API call per page view
+MANIFEST_PATH = os.getenv('MANIFEST_PATH') or os.path.join(
+    tempfile.gettempdir() if os.getenv('VERCEL') else app.instance_path, 'manifest.db')
+MANIFEST_TTL = int(os.getenv('MANIFEST_TTL', 86400 if CLOUDINARY_WEBHOOKS else 900))
+MANIFEST_SYNC_INTERVAL = int(os.getenv('MANIFEST_SYNC_INTERVAL', 21600 if CLOUDINARY_WEBHOOKS else 300))
+
+# Number of files of one batch sent to Cloudinary at the same time
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 6))
+
+# Bulk deletes go to storage in batches of the backend's batch_size, several at a time
+BULK_DELETE_CONCURRENCY = int(os.getenv('BULK_DELETE_CONCURRENCY', 4))
+
+# Uploads and deletes run as background jobs; the table sits next to the manifest so queued
+# work survives a restart. JOB_WORKERS=0 runs jobs inside the request (the default on Vercel,
+# where nothing keeps running once the response is sent).
+JOBS_PATH = os.getenv('JOBS_PATH') or os.path.join(os.path.dirname(MANIFEST_PATH), 'jobs.db')
+JOB_SPOOL_FOLDER = os.path.join(os.path.dirname(JOBS_PATH), 'spool')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 0 if os.getenv('VERCEL') else 4))
+
+# Where media is stored: cloudinary, local (LOCAL_STORAGE_PATH, served at LOCAL_STORAGE_URL) or
+# s3 (S3_BUCKET_NAME, S3_PREFIX, S3_REGION, S3_ENDPOINT_URL for S3-compatible servers, S3_PUBLIC_URL)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'cloudinary').lower()
+if STORAGE_BACKEND not in ('cloudinary', 'local', 's3'):
+    raise ValueError(f"STORAGE_BACKEND must be cloudinary, local or s3, not {STORAGE_BACKEND!r}")
+LOCAL_STORAGE_PATH = os.getenv('LOCAL_STORAGE_PATH') or os.path.join(app.instance_path, 'media')
+LOCAL_STORAGE_URL = '/media'
+
+# Let the browser upload straight to Cloudinary with signed parameters instead of through this app
+DIRECT_UPLOADS = STORAGE_BACKEND == 'cloudinary' and \
+    os.getenv('DIRECT_UPLOADS', 'true').lower() in ('1', 'true', 'yes')
+
+# Files whose SHA-256 is already in the manifest are reported as "already saved" instead of
+# being stored again. The browser hashes direct uploads itself, up to CLIENT_HASH_LIMIT bytes
+# (Web Crypto has no streaming digest, so the whole file is read into memory).
+DEDUPLICATE_UPLOADS = os.getenv('DEDUPLICATE_UPLOADS', 'true').lower() in ('1', 'true', 'yes')
+CLIENT_HASH_LIMIT = int(os.getenv('CLIENT_HASH_LIMIT', 256 * 1024 ** 2))
+
+# Photos get a 64-bit perceptual hash (dHash, needs Pillow) at upload; ones within
+# NEAR_DUPLICATE_THRESHOLD differing bits of a saved photo are flagged and listed on /duplicates.
+# Raising the threshold catches looser matches but makes the /duplicates scan slower.
+NEAR_DUPLICATES = os.getenv('NEAR_DUPLICATES', 'true').lower() in ('1', 'true', 'yes')
+NEAR_DUPLICATE_THRESHOLD = int(os.getenv('NEAR_DUPLICATE_THRESHOLD', 4))
+
+# Optional recompression of photos before they are sent to Cloudinary (needs Pillow): EXIF
+# orientation applied, metadata stripped, longest side capped, JPEGs re-encoded. Runs in a
+# process pool so a batch uses every core. Only uploads that pass through this app are processed.
+OPTIMIZE_IMAGES = os.getenv('OPTIMIZE_IMAGES', 'false').lower() in ('1', 'true', 'yes')
+OPTIMIZE_MAX_DIMENSION = int(os.getenv('OPTIMIZE_MAX_DIMENSION', 4096))
+OPTIMIZE_QUALITY = int(os.getenv('OPTIMIZE_QUALITY', 85))
+OPTIMIZE_WORKERS = int(os.getenv('OPTIMIZE_WORKERS', os.cpu_count() or 1))
+OPTIMIZE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Sized renditions for the gallery; DERIVATIVE_FORMAT=auto lets Cloudinary pick per browser.
+# EAGER_DERIVATIVES pre-generates them at upload time (only possible with a fixed format).
+# Other backends serve the originals.
+if STORAGE_BACKEND == 'cloudinary':
+    derivatives = CloudinaryDerivatives(
+        os.getenv('CLOUDINARY_CLOUD_NAME'),
+        image_format=os.getenv('DERIVATIVE_FORMAT', 'auto'),
+        quality=os.getenv('DERIVATIVE_QUALITY', 'auto'),
+        eager=os.getenv('EAGER_DERIVATIVES', 'false').lower() in ('1', 'true', 'yes'),
+    )
+else:
+    derivatives = OriginalDerivatives(lambda item: storage_backend().url(item), '/static/img/video-poster.svg')
+app.add_template_global(derivatives, 'derivatives')
+
+# Files downloaded ahead while an export streams; each one buffers at most a couple of MB
+EXPORT_PREFETCH = int(os.getenv('EXPORT_PREFETCH', 4))
+
+# Gallery pagination
+GALLERY_PAGE_SIZE = int(os.getenv('GALLERY_PAGE_SIZE', 60))
+MAX_PAGE_SIZE = 200
+# Query-string filters the gallery and /api/media accept
+FILTER_ARGS = ('from', 'to', 'type', 'q')
+
+# Anything besides the listing that changes what / or /api/media render; part of every ETag
+RENDER_VERSION = hashlib.blake2b(repr((
+    os.path.getmtime(os.path.join(app.root_path, 'templates', 'index.html')),
+    STORAGE_BACKEND, os.getenv('CLOUDINARY_CLOUD_NAME'), derivatives.image_format, derivatives.quality,
+    GALLERY_PAGE_SIZE, LARGE_UPLOAD_THRESHOLD, UPLOAD_CHUNK_SIZE, DIRECT_UPLOADS, DEDUPLICATE_UPLOADS, CLIENT_HASH_LIMIT,
+)).encode(), digest_size=6).hexdigest()
+
+def media_item(resource):
+    """MediaItem for a stored resource, with the poster frame recorded for videos"""
+    item = MediaItem.from_resource(resource)
+    if item.is_video:
+        item.poster = derivatives.poster_url(item)
+    return item
+
+def list_storage_media():
+    """Walk every page of the storage listing, images and videos alike"""
+    return [media_item(resource) for resource in storage_backend().list_all()]
+
+manifest = MediaManifest(MANIFEST_PATH, ttl=MANIFEST_TTL)
+manifest_sync = ManifestSync(manifest, list_storage_media, interval=MANIFEST_SYNC_INTERVAL)
+# Optimize pool workers re-import this file as __mp_main__ when it is run directly; only the
+# app itself runs the background threads
+if __name__ != '__mp_main__':
+    manifest_sync.start()
+
+jobs = JobQueue(JOBS_PATH, workers=JOB_WORKERS)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    if 'render_started' in g:
+        seconds = time.perf_counter() - g.pop('render_started')
+        RENDER_DURATION.observe(seconds, template=template.name)
+        server_timing('render', seconds, template.name)
+
+@app.after_request
+def record_request(response):
+    """Observe the request's latency and send its breakdown as a Server-Timing header"""
+    if 'request_started' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_DURATION.observe(seconds, method=request.method, endpoint=endpoint, status=response.status_code)
+    if response.status_code >= 500:
+        REQUEST_ERRORS.inc(endpoint=endpoint)
+
+    # Storage calls of the same kind are summed, so a paged listing shows up as one entry
+    totals = {}
+    for name, duration, description in g.get('server_timing', []):
+        key = (name, description)
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, total + duration)
+    entries = [f'app;dur={seconds * 1000:.1f}']
+    for index, ((name, description), (count, total)) in enumerate(totals.items()):
+        label = f'{description} x{count}' if count > 1 else description
+        entries.append(f'{name}-{index};desc="{label}";dur={total * 1000:.1f}' if label
+                       else f'{name}-{index};dur={total * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+_optimize_pool = None
+_hash_index = (None, None)  # (manifest version it reflects, HashIndex)
+_hash_index_lock = threading.Lock()
+
+def optimize_pool():
+    """Process pool for the recompression stage, started on first use (None if Pillow is missing)"""
+    global _optimize_pool
+    if _optimize_pool is None:
+        import optimize
+        if optimize.Image is None:
+            print('OPTIMIZE_IMAGES is set but Pillow is not installed; uploading photos unchanged')
+            return None
+        # Forking this threaded process could hand a worker a lock some other thread holds; a
+        # forkserver (spawn where there is none, e.g. Windows) starts workers from a clean process
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _optimize_pool = ProcessPoolExecutor(max_workers=OPTIMIZE_WORKERS,
+                                             mp_context=multiprocessing.get_context(method))
+    return _optimize_pool
+
+def optimize_upload(path, filename):
+    """Recompress a spooled photo in the process pool; returns the optimizer's report or None"""
+    if not OPTIMIZE_IMAGES or filename.rsplit('.', 1)[-1].lower() not in OPTIMIZE_EXTENSIONS:
+        return None
+    pool = optimize_pool()
+    if pool is None:
+        return None
+    import optimize
+    try:
+        return pool.submit(optimize.optimize_image, path, OPTIMIZE_MAX_DIMENSION, OPTIMIZE_QUALITY).result()
+    except Exception as e:
+        # A photo Pillow cannot read still goes up as it is
+        print(f'Optimizing {filename} failed: {e}')
+        return None
+
+def perceptual_hash_of(path, filename):
+    """dHash of a spooled photo, or None for videos, unreadable files or when detection is off"""
+    if not NEAR_DUPLICATES or upload_resource_type(filename) == 'video':
+        return None
+    from similarity import dhash_file
+    return dhash_file(path)
+
+def fetch_perceptual_hash(item):
+    """dHash of a photo uploaded straight to Cloudinary, read from a 64x64 rendition"""
+    if not NEAR_DUPLICATES or item.is_video:
+        return None
+    from similarity import dhash_file
+    try:
+        response = cloudinary_sdk().http.request('GET', derivatives.hash_source_url(item), timeout=10)
+    except Exception as e:
+        print(f'Fetching {item.public_id} for its perceptual hash failed: {e}')
+        return None
+    return dhash_file(io.BytesIO(response.data)) if response.status == 200 else None
+
+def hash_index():
+    """HashIndex of every photo's perceptual hash
+
+    Loaded from the manifest once; this process's own writes go through indexed_write() and
+    patch it in place, so it is reloaded only when something else (a reconcile, another
+    worker) changed the listing.
+    """
+    global _hash_index
+    with _hash_index_lock:
+        version = manifest.version()[0]
+        if _hash_index[1] is None or _hash_index[0] != version:
+            from similarity import HashIndex
+            _hash_index = (version, HashIndex(*manifest.perceptual_hashes()))
+        return _hash_index[1]
 
-if not USERNAME or not PASSWORD:
-    raise ValueError("USERNAME and PASSWORD must be set in environment variables")
+@contextmanager
+def indexed_write(upserted=(), removed=()):
+    """Wrap a manifest write so the loaded hash index takes the same change
 
-PASSWORD_HASH = generate_password_hash(PASSWORD)
+    ``upserted`` items are read after the write, once the manifest has filled in what it
+    kept for them. A write bumps the version by one; any other jump means someone else
+    changed the listing too, and the index is left to reload.
+    """
+    global _hash_index
+    with _hash_index_lock:
+        before = manifest.version()[0]
+        yield
+        after = manifest.version()[0]
+        version, index = _hash_index
+        if index is None or version != before or after != before + 1:
+            return
+        for public_id in removed:
+            index.discard(public_id)
+        for item in upserted:
+            if item.perceptual_hash:
+                index.add(item.public_id, item.perceptual_hash)
+            else:
+                index.discard(item.public_id)
+        _hash_index = (after, index)
+
+def near_duplicates_of(perceptual_hash):
+    """public_ids of saved photos that look like this one, closest first"""
+    if not NEAR_DUPLICATES or not perceptual_hash:
+        return []
+    index = hash_index()
+    with _hash_index_lock:
+        return [public_id for public_id, _ in index.search(perceptual_hash, NEAR_DUPLICATE_THRESHOLD)]
+
+def near_duplicate_groups():
+    """Groups of public_ids whose photos look alike; worked out once, then kept current by the index"""
+    index = hash_index()
+    with _hash_index_lock:
+        return index.groups(NEAR_DUPLICATE_THRESHOLD)
 
 def login_required(f):
     @wraps(f)
@@ -46,23 +395,354 @@ def allowed_file(filename):
     """Check if the uploaded file has an allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def media_json(item):
+    """A MediaItem as the gallery scripts consume it"""
+    return dict(item.to_dict(), **derivatives.urls(item), delete_url=url_for('delete_file', filename=item.filename))
+
+
+def parse_date_filter(value, end=False):
+    """Unix time for a 'YYYY-MM-DD', 'YYYY-MM' or ISO time filter; a whole day or month given
+    as the end of a range is included, so it resolves to the start of the next one"""
+    try:
+        if len(value) == 7:
+            start = datetime.strptime(value, '%Y-%m')
+            bound = (start + timedelta(days=31)).replace(day=1) if end else start
+        elif len(value) == 10:
+            bound = datetime.strptime(value, '%Y-%m-%d') + timedelta(days=1 if end else 0)
+        else:
+            bound = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+    return (bound if bound.tzinfo else bound.replace(tzinfo=timezone.utc)).timestamp()
+
+def listing_filters(filters):
+    """manifest.page keyword arguments for the gallery's query-string filters; ValueError if one is invalid"""
+    resource_type = filters.get('type')
+    if resource_type not in (None, 'image', 'video'):
+        raise ValueError('type must be image or video')
+    return {
+        'taken_from': parse_date_filter(filters['from']) if filters.get('from') else None,
+        'taken_to': parse_date_filter(filters['to'], end=True) if filters.get('to') else None,
+        'resource_type': resource_type,
+        'query': filters.get('q'),
+    }
+
+def listing_validators(*parts):
+    """(etag, last_modified) for a listing response, or (None, None) before the first sync
+
+    Read from the manifest's version counter, so working them out costs one SQLite lookup
+    and no storage call or rendering.
+    """
+    version, modified_at = manifest.version()
+    if not version:
+        return None, None
+    digest = hashlib.blake2b(repr((RENDER_VERSION,) + parts).encode(), digest_size=6).hexdigest()
+    return f'{version}-{digest}', modified_at
+
+def not_modified(etag, last_modified):
+    """A 304 for the caller's cached copy if it is still current, otherwise None"""
+    if etag is None:
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        # HTTP dates have one-second resolution
+        fresh = request.if_modified_since is not None and int(last_modified) <= request.if_modified_since.timestamp()
+    if not fresh:
+        return None
+    # The listing is still served from the manifest, so keep it on its refresh schedule
+    manifest_sync.ensure_fresh()
+    return with_validators(app.response_class(status=304), etag, last_modified)
+
+def with_validators(response, etag, last_modified):
+    """Let the browser keep the response but revalidate it on every use"""
+    if etag is None:
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 
 @app.route('/')
 @login_required
 def index():
     """Show upload form + gallery"""
+    # Pages that show flash messages are one-off, so they are neither answered with 304 nor cached
+    flashes_pending = bool(session.get('_flashes'))
+    filters = {key: request.args[key] for key in FILTER_ARGS if request.args.get(key)}
+    etag, last_modified = (None, None) if flashes_pending else listing_validators('index', *sorted(filters.items()))
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    next_cursor = None
     try:
-        # List resources from Cloudinary
-        result = cloudinary.api.resources(type='upload', max_results=500)
-        files = []
-        if 'resources' in result:
-            # Sort by created_at, most recent first
-            files = sorted([resource['public_id'] + '.' + resource['format'] for resource in result['resources']],
-                         key=lambda x: next((r['created_at'] for r in result['resources'] if r['public_id'] + '.' + r['format'] == x), ''), reverse=True)
+        # Render only the first page from the local manifest; the gallery fetches the rest from /api/media
+        manifest_sync.ensure_fresh()
+        if not flashes_pending:
+            # Read before the page so a racing upload can only make the ETag older than the body
+            etag, last_modified = listing_validators('index', *sorted(filters.items()))
+        items, next_cursor = manifest.page(limit=GALLERY_PAGE_SIZE, **listing_filters(filters))
     except Exception as e:
         flash(f'Error loading files: {str(e)} ❌')
-        files = []
-    return render_template('index.html', files=files)
+        items = []
+        etag = None
+    response = app.make_response(render_template(
+        'index.html', items=items, next_cursor=next_cursor, filters=filters,
+        large_upload_threshold=LARGE_UPLOAD_THRESHOLD, upload_chunk_size=UPLOAD_CHUNK_SIZE,
+        direct_uploads=DIRECT_UPLOADS, client_hash_limit=CLIENT_HASH_LIMIT if DEDUPLICATE_UPLOADS else 0))
+    return with_validators(response, etag, last_modified)
+
+
+@app.route('/api/media')
+@login_required
+def api_media():
+    """Cursor-paginated JSON listing of the gallery, most recently taken first
+
+    Takes the same filters as the gallery page: ``from`` and ``to`` (dates, both inclusive,
+    or ISO times), ``type`` (image or video) and ``q`` (part of the original filename).
+    """
+    limit = min(max(request.args.get('limit', GALLERY_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor') or None
+    filters = {key: request.args[key] for key in FILTER_ARGS if request.args.get(key)}
+    parts = ('api_media', cursor, limit, *sorted(filters.items()))
+    cached = not_modified(*listing_validators(*parts))
+    if cached:
+        return cached
+    try:
+        manifest_sync.ensure_fresh()
+        etag, last_modified = listing_validators(*parts)
+        items, next_cursor = manifest.page(cursor, limit=limit, **listing_filters(filters))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_validators(jsonify({
+        'items': [media_json(item) for item in items],
+        'next_cursor': next_cursor,
+    }), etag, last_modified)
+
+
+@app.route('/on-this-day')
+@login_required
+def on_this_day():
+    """Everything taken on today's date (or ``date``, as MM-DD) in any year, straight from the index"""
+    month_day = request.args.get('date') or time.strftime('%m-%d')
+    try:
+        # A leap year, so 02-29 is a valid date
+        day = datetime.strptime(f'2000-{month_day}', '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'date must be MM-DD'}), 400
+    month_day = day.strftime('%m-%d')
+    title = f"On this day: {day.strftime('%B')} {day.day}"
+    parts = ('on_this_day', month_day)
+    cached = not_modified(*listing_validators(*parts))
+    if cached:
+        return cached
+    manifest_sync.ensure_fresh()
+    etag, last_modified = listing_validators(*parts)
+    items = manifest.on_this_day(month_day)
+    if wants_json():
+        response = jsonify({'date': month_day, 'items': [media_json(item) for item in items]})
+    else:
+        response = app.make_response(render_template(
+            'index.html', items=items, next_cursor=None, filters={}, view_title=title,
+            large_upload_threshold=LARGE_UPLOAD_THRESHOLD, upload_chunk_size=UPLOAD_CHUNK_SIZE,
+            direct_uploads=DIRECT_UPLOADS, client_hash_limit=CLIENT_HASH_LIMIT if DEDUPLICATE_UPLOADS else 0))
+    return with_validators(response, etag, last_modified)
+
+
+@app.route('/duplicates')
+@login_required
+def duplicates():
+    """Photos that look alike (bursts, resized or re-sent copies), grouped so extra copies can be deleted"""
+    cached = not_modified(*listing_validators('duplicates', NEAR_DUPLICATE_THRESHOLD))
+    if cached:
+        return cached
+    manifest_sync.ensure_fresh()
+    etag, last_modified = listing_validators('duplicates', NEAR_DUPLICATE_THRESHOLD)
+    groups = near_duplicate_groups() if NEAR_DUPLICATES else []
+    found = manifest.get_many(public_id for group in groups for public_id in group)
+    # Newest first within a group; members deleted since the groups were worked out drop out
+    groups = [sorted((found[public_id] for public_id in group if public_id in found),
+                     key=attrgetter('taken_at'), reverse=True) for group in groups]
+    groups = [group for group in groups if len(group) > 1]
+    if wants_json():
+        response = jsonify({'threshold': NEAR_DUPLICATE_THRESHOLD,
+                            'groups': [[media_json(item) for item in group] for group in groups]})
+    else:
+        response = app.make_response(render_template(
+            'index.html', items=[], groups=groups, next_cursor=None, filters={},
+            view_title=f'Photos that look alike: {len(groups)} group(s)',
+            large_upload_threshold=LARGE_UPLOAD_THRESHOLD, upload_chunk_size=UPLOAD_CHUNK_SIZE,
+            direct_uploads=DIRECT_UPLOADS, client_hash_limit=CLIENT_HASH_LIMIT if DEDUPLICATE_UPLOADS else 0))
+    return with_validators(response, etag, last_modified)
+
+
+@app.route('/api/timeline')
+@login_required
+def api_timeline():
+    """Item counts per month taken, newest first, for jumping through the library"""
+    cached = not_modified(*listing_validators('api_timeline'))
+    if cached:
+        return cached
+    manifest_sync.ensure_fresh()
+    etag, last_modified = listing_validators('api_timeline')
+    return with_validators(jsonify({'months': [{'month': month, 'count': count}
+                                               for month, count in manifest.months()]}), etag, last_modified)
+
+
+def wants_json():
+    """True when the caller (the upload form's fetch) asked for a JSON response"""
+    return request.accept_mimetypes.best == 'application/json'
+
+def new_public_id(filename):
+    """Generate unique public_id to prevent overwriting"""
+    name, ext = os.path.splitext(secure_filename(filename))
+    return f"{uuid.uuid4().hex}_{name}"
+
+def upload_resource_type(filename):
+    return 'video' if filename.rsplit('.', 1)[-1].lower() in VIDEO_EXTENSIONS else 'image'
+
+def duplicate_of(content_hash):
+    """The stored asset with the same bytes, or None"""
+    if not DEDUPLICATE_UPLOADS or not content_hash:
+        return None
+    return manifest.find_by_hash(content_hash)
+
+def duplicate_result(filename, item):
+    return {'filename': filename, 'ok': True, 'duplicate': True, 'item': item}
+
+def spool_upload(stream, filename):
+    """Copy an upload to the job spool a chunk at a time, hashing it on the way; returns (path, size, sha256)"""
+    path = spool_path(filename)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as spool:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+def upload_path(path, filename, content_hash=None):
+    """Upload one spooled file to storage and record it, returning a per-file result instead of raising"""
+    # Checked again here in case the same bytes were uploaded while this job sat in the queue
+    existing = duplicate_of(content_hash)
+    if existing:
+        return duplicate_result(filename, existing.to_dict())
+    try:
+        # Taken from the original, before recompression and before the upload joins the index
+        perceptual_hash = perceptual_hash_of(path, filename)
+        similar_to = near_duplicates_of(perceptual_hash)
+        # The hash stays that of the bytes as received, so re-sending the same original is still caught
+        report = optimize_upload(path, filename) or {}
+        # The optimizer reads it before re-encoding; videos and photos it skipped are read here
+        from capture import capture_date
+        captured_at = report.get('captured_at') or capture_date(path)
+        # Kept with the asset so the manifest can be rebuilt from a re-listing
+        metadata = {'content_hash': content_hash, 'captured_at': captured_at, 'original_filename': filename,
+                    'perceptual_hash': perceptual_hash}
+        result = storage_backend().put(path, filename, new_public_id(filename), upload_resource_type(filename),
+                                       metadata)
+        item = media_item(result)
+        with indexed_write(upserted=[item]):
+            manifest.upsert(item)
+    except Exception as e:
+        return {'filename': filename, 'ok': False, 'error': str(e)}
+    UPLOAD_BYTES.inc(os.path.getsize(path), path='server')
+    return {'filename': filename, 'ok': True, 'item': item.to_dict(), 'bytes_saved': report.get('bytes_saved', 0),
+            'similar_to': similar_to}
+
+def run_upload_job(payload, progress):
+    """Job handler: upload a batch of spooled files on a bounded thread pool"""
+    files = payload['files']
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(UPLOAD_CONCURRENCY, len(files)))) as pool:
+            for result in pool.map(lambda file: upload_path(file['path'], file['filename'], file.get('content_hash')),
+                                   files):
+                results.append(result)
+                progress(len(results))
+    finally:
+        for file in files:
+            if os.path.exists(file['path']):
+                os.remove(file['path'])
+    return upload_summary(results)
+
+def upload_summary(results):
+    duplicate_count = sum(bool(result.get('duplicate')) for result in results)
+    uploaded_count = sum(result['ok'] for result in results) - duplicate_count
+    return {'uploaded': uploaded_count, 'duplicates': duplicate_count,
+            'failed': len(results) - uploaded_count - duplicate_count,
+            'similar': sum(bool(result.get('similar_to')) for result in results),
+            'bytes_saved': sum(result.get('bytes_saved', 0) for result in results), 'results': results}
+
+def run_delete_job(payload, progress):
+    """Job handler: batched deletes of a list of public_ids"""
+    results = delete_many(payload['public_ids'], payload.get('resource_types'))
+    progress(len(results))
+    deleted_count = sum(result['ok'] for result in results)
+    return {'deleted': deleted_count, 'failed': len(results) - deleted_count, 'results': results}
+
+def spool_path(filename):
+    os.makedirs(JOB_SPOOL_FOLDER, exist_ok=True)
+    return os.path.join(JOB_SPOOL_FOLDER, f'{uuid.uuid4().hex}_{secure_filename(filename)}')
+
+def job_response(job_id, **extra):
+    """202 with the job's current state and the URL to poll for the rest"""
+    return jsonify(dict(job_json(jobs.get(job_id)), **extra)), 202
+
+def job_json(job):
+    """A job as /jobs/<id> reports it, with uploaded items expanded the way the gallery consumes them"""
+    result = job['result']
+    if job['kind'] == 'upload' and result:
+        result = dict(result, results=[
+            dict(entry, item=media_json(MediaItem.from_resource(entry['item']))) if entry['ok'] else entry
+            for entry in result['results']
+        ])
+    return dict(job, result=result, status_url=url_for('job_status', job_id=job['id']))
+
+def flash_upload_summary(summary):
+    for entry in summary['results']:
+        if not entry['ok']:
+            flash(f"Upload failed for {entry['filename']}: {entry['error']} ❌")
+    if summary['duplicates'] > 0:
+        flash(f"{summary['duplicates']} file(s) already saved 💾")
+    if summary['uploaded'] > 0:
+        saved = f" ({summary['bytes_saved'] / 1024 ** 2:.1f} MB saved by recompression)" if summary['bytes_saved'] else ''
+        flash(f"{summary['uploaded']} file(s) uploaded successfully 💖{saved}")
+    elif not summary['duplicates']:
+        flash('No valid files uploaded ❌')
+    if summary.get('similar'):
+        flash(f"{summary['similar']} photo(s) look a lot like ones already saved, see Duplicates 👯")
+
+def flash_job(job, queued_message):
+    """Flash the outcome of a job that already finished (inline workers), or that it is queued"""
+    result = job['result']
+    if job['status'] == 'failed':
+        flash(f"{job['kind'].capitalize()} failed: {job['error']} ❌")
+    elif job['status'] != 'done':
+        flash(queued_message)
+    elif job['kind'] == 'upload':
+        flash_upload_summary(result)
+    else:
+        if result['deleted']:
+            flash(f"{result['deleted']} file(s) deleted successfully 🗑️")
+        if result['failed']:
+            flash(f"Failed to delete {result['failed']} file(s) ❌")
+
+jobs.register('upload', run_upload_job)
+jobs.register('delete', run_delete_job)
+if __name__ != '__mp_main__':
+    jobs.start()
 
 
 @app.route('/upload', methods=['POST'])
@@ -70,53 +750,408 @@ def index():
 def upload_file():
     """Handle file uploads to Cloudinary"""
     if 'file' not in request.files:
+        if wants_json():
+            return jsonify({'error': 'No file part in the form'}), 400
         flash('No file part in the form ❌')
         return redirect(url_for('index'))
 
-    files = request.files.getlist('file')
+    files = [file for file in request.files.getlist('file') if file and file.filename]
 
-    if not files or all(file.filename == '' for file in files):
+    if not files:
+        if wants_json():
+            return jsonify({'error': 'No file selected'}), 400
         flash('No file selected ⚠️')
         return redirect(url_for('index'))
 
-    uploaded_count = 0
+    # Settled in the request: files of the wrong type and bytes that are already stored
+    settled = []
+    spooled = []
     for file in files:
-        if file and allowed_file(file.filename):
-            # Generate unique public_id to prevent overwriting
-            name, ext = os.path.splitext(secure_filename(file.filename))
-            unique_public_id = f"{uuid.uuid4().hex}_{name}"
-            try:
-                # Upload to Cloudinary
-                result = cloudinary.uploader.upload(file, public_id=unique_public_id, resource_type='auto')
-                uploaded_count += 1
-            except Exception as e:
-                flash(f'Upload failed: {str(e)} ❌')
-                return redirect(url_for('index'))
-
-    if uploaded_count > 0:
-        flash(f'{uploaded_count} file(s) uploaded successfully 💖')
-    else:
-        flash('No valid files uploaded ❌')
+        if not allowed_file(file.filename):
+            settled.append({'filename': file.filename, 'ok': False, 'error': 'File type not allowed'})
+            continue
+        path, size, content_hash = spool_upload(file.stream, file.filename)
+        existing = duplicate_of(content_hash)
+        if existing or any(spool['content_hash'] == content_hash for spool in spooled):
+            os.remove(path)
+            item = media_json(existing) if existing else None
+            settled.append(duplicate_result(file.filename, item))
+            continue
+        spooled.append({'path': path, 'filename': file.filename, 'content_hash': content_hash})
+
+    if not spooled:
+        summary = upload_summary(settled)
+        if wants_json():
+            return jsonify(summary)
+        flash_upload_summary(summary)
+        return redirect(url_for('index'))
+
+    # The request only spools the files to disk; a job worker sends them to Cloudinary
+    job_id = jobs.enqueue('upload', {'files': spooled}, total=len(spooled))
+    if wants_json():
+        return job_response(job_id, settled=settled)
+
+    for result in settled:
+        if result['ok']:
+            flash(f"{result['filename']} is already saved 💾")
+        else:
+            flash(f"Upload failed for {result['filename']}: {result['error']} ❌")
+    flash_job(jobs.get(job_id), f'Uploading {len(spooled)} file(s) in the background ⏳')
+    return redirect(url_for('index'))
+
+
+@app.route('/upload/stream', methods=['POST'])
+@login_required
+def upload_stream():
+    """Accept one large file sent as the raw request body, copying it to the job spool a chunk at a time"""
+    filename = unquote(request.headers.get('X-Filename', ''))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if not request.content_length:
+        return jsonify({'error': 'Content-Length is required'}), 411
+    if request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        abort(413)
+
+    try:
+        path, size, content_hash = spool_upload(request.stream, filename)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    if size != request.content_length:
+        os.remove(path)
+        return jsonify({'error': f'Upload body ended after {size} of {request.content_length} bytes'}), 400
+
+    existing = duplicate_of(content_hash)
+    if existing:
+        os.remove(path)
+        return jsonify(upload_summary([duplicate_result(filename, media_json(existing))]))
+    return job_response(jobs.enqueue('upload', {'files': [{'path': path, 'filename': filename,
+                                                           'content_hash': content_hash}]}, total=1))
+
+
+def signed_upload_params(filename, content_hash=None):
+    """Signed parameters for one browser-to-Cloudinary upload under a fresh public_id
+
+    Cloudinary refuses signatures whose timestamp is more than an hour old, which is
+    what keeps these short-lived.
+    """
+    resource_type = upload_resource_type(filename)
+    params = storage_backend().upload_options(new_public_id(filename), resource_type,
+                                              {'content_hash': content_hash, 'original_filename': filename})
+    params.pop('resource_type')
+    # The file never passes through this server, so Cloudinary reports the EXIF capture date instead
+    params['media_metadata'] = 'true'
+    params['timestamp'] = int(time.time())
+    config = cloudinary_sdk().config()
+    return {
+        'filename': filename,
+        'public_id': params['public_id'],
+        'upload_url': cloudinary_sdk().utils.cloudinary_api_url('upload', resource_type=resource_type),
+        # Every field the browser must post along with the file
+        'fields': dict(params, signature=cloudinary_sdk().utils.api_sign_request(params, config.api_secret),
+                       api_key=config.api_key),
+    }
+
+
+@app.route('/upload/signature', methods=['POST'])
+@login_required
+def upload_signature():
+    """Issue signed upload parameters so the browser sends media bytes straight to Cloudinary"""
+    payload = request.get_json(silent=True) or {}
+    filenames = payload.get('filenames') or []
+    if not isinstance(filenames, list) or not filenames:
+        return jsonify({'error': 'No file selected'}), 400
+    # SHA-256 of each file as the browser computed it (null where it did not), for deduplication
+    hashes = payload.get('hashes') or []
+    if not isinstance(hashes, list):
+        hashes = []
+    hashes = [content_hash if isinstance(content_hash, str) and len(content_hash) == 64 else None
+              for content_hash in hashes] + [None] * (len(filenames) - len(hashes))
+
+    uploads = []
+    for filename, content_hash in zip(filenames, hashes):
+        existing = duplicate_of(content_hash)
+        if not isinstance(filename, str) or not allowed_file(filename):
+            uploads.append({'filename': filename, 'error': 'File type not allowed'})
+        elif existing:
+            uploads.append(duplicate_result(filename, media_json(existing)))
+        elif content_hash and content_hash in hashes[:len(uploads)]:
+            uploads.append(duplicate_result(filename, None))
+        else:
+            uploads.append(signed_upload_params(filename, content_hash))
+    return jsonify({'uploads': uploads})
+
+
+def uploaded_resource(public_id, resource_type=None):
+    """Cloudinary's own record of an uploaded asset, or None when there is none
+
+    ``resource_type`` is only where to look first; the Admin API keeps images and videos apart.
+    """
+    from cloudinary.exceptions import NotFound
+    for kind in dict.fromkeys((resource_type, 'image', 'video')):
+        if kind not in ('image', 'video'):
+            continue
+        try:
+            return cloudinary_sdk().api.resource(public_id, resource_type=kind, type='upload', context=True,
+                                                 media_metadata=True)
+        except NotFound:
+            continue
+    return None
+
+@app.route('/upload/complete', methods=['POST'])
+@login_required
+def upload_complete():
+    """Record an asset the browser finished uploading, after checking Cloudinary signed the response
+
+    The signature covers only public_id and version, so everything else is read back from
+    Cloudinary rather than taken from the browser.
+    """
+    result = request.get_json(silent=True) or {}
+    filename = result.get('filename') or result.get('public_id')
+    try:
+        verified = cloudinary_sdk().utils.verify_api_response_signature(
+            result['public_id'], result['version'], result['signature'])
+    except KeyError:
+        verified = False
+    if not verified:
+        return jsonify({'filename': filename, 'ok': False, 'error': 'Invalid upload signature'}), 400
+    try:
+        resource = uploaded_resource(result['public_id'], result.get('resource_type'))
+    except Exception as e:
+        return jsonify({'filename': filename, 'ok': False, 'error': str(e)}), 502
+    if resource is None:
+        return jsonify({'filename': filename, 'ok': False, 'error': 'Upload not found'}), 400
+    item = media_item(resource)
+    item.perceptual_hash = fetch_perceptual_hash(item)
+    similar_to = near_duplicates_of(item.perceptual_hash)
+    with indexed_write(upserted=[item]):
+        manifest.upsert(item)
+    UPLOAD_BYTES.inc(item.bytes or 0, path='direct')
+    return jsonify({'filename': filename, 'ok': True, 'item': media_json(item), 'similar_to': similar_to})
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Reject oversized bodies in the same shape the upload form expects"""
+    message = f"Upload is larger than the {app.config['MAX_CONTENT_LENGTH'] // 1024 ** 2} MB limit"
+    if wants_json():
+        return jsonify({'error': message}), 413
+    flash(f'{message} ❌')
     return redirect(url_for('index'))
 
 
 @app.route('/delete/<filename>', methods=['POST'])
 @login_required
 def delete_file(filename):
-    """Delete selected file from Cloudinary"""
+    """Queue deletion of one file from storage"""
+    # Extract public_id from filename (remove extension)
+    public_id = filename.rsplit('.', 1)[0]
+    # The extension says whether it is a video, in case the manifest has not seen it yet
+    resource_types = {public_id: upload_resource_type(filename)} if '.' in filename else {}
+    job_id = jobs.enqueue('delete', {'public_ids': [public_id], 'resource_types': resource_types}, total=1)
+    if wants_json():
+        return job_response(job_id)
+    flash_job(jobs.get(job_id), f'Deleting {filename} in the background ⏳')
+    return redirect(url_for('index'))
+
+
+def delete_batch(items):
+    """One storage delete call for up to the backend's batch_size assets of the same resource_type"""
     try:
-        # Extract public_id from filename (remove extension)
-        public_id = filename.rsplit('.', 1)[0]
-        result = cloudinary.uploader.destroy(public_id)
-        if result.get('result') == 'ok':
-            flash(f'{filename} deleted successfully 🗑️')
-        else:
-            flash(f'Failed to delete {filename} ❌')
+        return storage_backend().delete(items)
     except Exception as e:
-        flash(f'Delete failed: {str(e)} ❌')
+        return {item.public_id: str(e) for item in items}
+
+def delete_items(items):
+    """{public_id: error, None or NOT_FOUND} from batched, concurrent storage calls per resource_type"""
+    by_type = {}
+    for item in items:
+        by_type.setdefault(item.resource_type, []).append(item)
+    batch_size = storage_backend().batch_size
+    batches = [items[i:i + batch_size] for items in by_type.values() for i in range(0, len(items), batch_size)]
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(BULK_DELETE_CONCURRENCY, len(batches)))) as pool:
+        for batch_errors in pool.map(delete_batch, batches):
+            errors.update(batch_errors)
+    return errors
+
+def delete_many(public_ids, resource_types=None):
+    """Delete assets from storage and drop them from the manifest
+
+    ``resource_types`` ({public_id: type}, e.g. from file extensions) covers assets the
+    manifest has not seen yet; any other unknown public_id is tried as an image, then as a video.
+    """
+    from backends import NOT_FOUND
+    public_ids = list(dict.fromkeys(public_ids))
+    resource_types = resource_types or {}
+    known = manifest.get_many(public_ids)
+    errors = delete_items([known.get(public_id) or MediaItem(public_id, '', resource_types.get(public_id, 'image'))
+                           for public_id in public_ids])
+    guessed = [MediaItem(public_id, '', 'video') for public_id in public_ids
+               if public_id not in known and public_id not in resource_types and errors.get(public_id) == NOT_FOUND]
+    if guessed:
+        errors.update(delete_items(guessed))
+
+    # Nothing found under the known type (or under either, for a guess) means it is already gone
+    results = [{'public_id': public_id, 'ok': errors.get(public_id) in (None, NOT_FOUND),
+                'error': None if errors.get(public_id) == NOT_FOUND else errors.get(public_id)}
+               for public_id in public_ids]
+    deleted = [result['public_id'] for result in results if result['ok']]
+    with indexed_write(removed=deleted):
+        manifest.remove_many(deleted)
+    return results
+
+
+@app.route('/delete', methods=['POST'])
+@login_required
+def bulk_delete():
+    """Queue deletion of a list of public_ids (JSON {"public_ids": [...]} or repeated public_id form fields)"""
+    payload = request.get_json(silent=True) or {}
+    public_ids = payload.get('public_ids') or request.form.getlist('public_id')
+    if not isinstance(public_ids, list) or not all(isinstance(public_id, str) for public_id in public_ids):
+        public_ids = []
+
+    if not public_ids:
+        if wants_json():
+            return jsonify({'error': 'No file selected'}), 400
+        flash('No file selected ⚠️')
+        return redirect(url_for('index'))
+
+    job_id = jobs.enqueue('delete', {'public_ids': public_ids}, total=len(public_ids))
+    if wants_json():
+        return job_response(job_id)
+    flash_job(jobs.get(job_id), f'Deleting {len(public_ids)} file(s) in the background ⏳')
     return redirect(url_for('index'))
 
 
+@app.route(f'{LOCAL_STORAGE_URL}/<filename>')
+@login_required
+def local_media(filename):
+    """Originals of the local storage backend"""
+    path = storage_backend().path(filename) if STORAGE_BACKEND == 'local' else None
+    if not path or not os.path.isfile(path):
+        abort(404)
+    # Stored names are unique, so an original never changes once written
+    response = send_file(path, conditional=True, max_age=31536000)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
+def export_entries(items):
+    """ExportEntry per item, named as uploaded and dated when it was taken"""
+    backend = storage_backend()
+    names = archive_names(item.filename for item in items)
+    # ZIP timestamps cannot predate 1980
+    return [ExportEntry(name, partial(backend.open, item), max(item.taken_at.timetuple()[:6], (1980, 1, 1, 0, 0, 0)),
+                        item.bytes) for item, name in zip(items, names)]
+
+
+@app.route('/export', methods=['GET', 'POST'])
+@login_required
+def export():
+    """Stream a ZIP of the selected items (POSTed public_id fields) or, on GET, of the whole library
+
+    The archive is written while it downloads, so nothing is held in memory or on disk.
+    Serverless hosts (Vercel) buffer and cap response bodies, so big exports need a
+    long-running server.
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        public_ids = payload.get('public_ids') or request.form.getlist('public_id')
+        if not isinstance(public_ids, list):
+            public_ids = []
+        items = [item for item in (manifest.get(public_id) for public_id in dict.fromkeys(public_ids)
+                                   if isinstance(public_id, str)) if item]
+    else:
+        manifest_sync.ensure_fresh()
+        items = manifest.all()
+    if not items:
+        if wants_json():
+            return jsonify({'error': 'No file selected'}), 400
+        flash('Nothing to download ⚠️')
+        return redirect(url_for('index'))
+
+    filename = f"memories-{time.strftime('%Y-%m-%d')}.zip"
+    response = app.response_class(stream_zip(export_entries(items), prefetch=EXPORT_PREFETCH),
+                                  mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Tell nginx to pass the stream through rather than buffer it
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Progress and, once finished, the result of an upload or delete job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_json(job))
+
+
+def verify_webhook(body, timestamp, signature):
+    """True if a notification body carries Cloudinary's signature and is recent enough"""
+    try:
+        if int(timestamp) < time.time() - WEBHOOK_MAX_AGE:
+            return False
+    except (TypeError, ValueError):
+        return False
+    config = cloudinary_sdk().config()
+    if not config.api_secret or not signature:
+        return False
+    expected = cloudinary_sdk().utils.compute_hex_hash(f'{body}{timestamp}{config.api_secret}',
+                                                       config.signature_algorithm)
+    # Headers arrive decoded as latin-1; compare_digest raises on non-ASCII str, but not on bytes
+    return hmac.compare_digest(expected.encode(), signature.encode('latin-1'))
+
+def apply_notification(notification):
+    """Apply one upload, delete or rename notification to the manifest and say what was done"""
+    kind = notification.get('notification_type')
+    if kind == 'upload':
+        if notification.get('type', 'upload') != 'upload':
+            return 'ignored'
+        item = media_item(notification)
+        with indexed_write(upserted=[item]):
+            manifest.upsert(item)
+        return 'upserted'
+    if kind == 'delete':
+        public_ids = [resource['public_id'] for resource in notification.get('resources', [])
+                      if resource.get('type', 'upload') == 'upload']
+        with indexed_write(removed=public_ids):
+            manifest.remove_many(public_ids)
+        return 'removed'
+    if kind == 'rename':
+        if notification.get('type', 'upload') != 'upload':
+            return 'ignored'
+        item = manifest.get(notification['from_public_id'])
+        if item is None:
+            # Renamed from something the manifest never saw, so there is no metadata to carry over
+            manifest_sync.reconcile_async()
+            return 'resync'
+        # media_item recomputes the poster URL, which contains the public_id
+        renamed = media_item(dict(item.to_dict(), public_id=notification['to_public_id']))
+        with indexed_write(upserted=[renamed], removed=[notification['from_public_id']]):
+            manifest.rename(notification['from_public_id'], renamed)
+        return 'renamed'
+    return 'ignored'
+
+
+@app.route('/hooks/cloudinary', methods=['POST'])
+def cloudinary_webhook():
+    """Incremental manifest updates from Cloudinary notifications, authenticated by their signature"""
+    body = request.get_data(as_text=True)
+    if not verify_webhook(body, request.headers.get('X-Cld-Timestamp'), request.headers.get('X-Cld-Signature')):
+        return jsonify({'error': 'Invalid signature'}), 401
+    try:
+        result = apply_notification(json.loads(body))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'Malformed notification: {e}'}), 400
+    return jsonify({'result': result})
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Handle login"""
@@ -124,7 +1159,7 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        if username == USERNAME and check_password_hash(PASSWORD_HASH, password):
+        if username == USERNAME and check_password_hash(password_hash(), password):
             session['logged_in'] = True
             flash('Login successful! 💖')
             return redirect(url_for('index'))
@@ -143,6 +1178,24 @@ def logout():
     return redirect(url_for('login'))
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: request, storage and render latency, upload bytes and error counts"""
+    authorization = request.headers.get('Authorization', '')
+    # As bytes: compare_digest raises on str with non-ASCII characters, which any client can send
+    token_ok = METRICS_TOKEN and hmac.compare_digest(authorization.encode('latin-1'),
+                                                     f'Bearer {METRICS_TOKEN}'.encode())
+    if not token_ok and 'logged_in' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Storage state is sampled at scrape time rather than pushed on every call
+    if _cloudinary is not None:
+        if _cloudinary.rate_limit_remaining is not None:
+            RATE_LIMIT_REMAINING.set(_cloudinary.rate_limit_remaining)
+        for name, breaker in _cloudinary.breakers.items():
+            CIRCUIT_OPEN.set(int(breaker.is_open), api=name)
+    return metrics.render(), 200, {'Content-Type': metrics.content_type}
+
+
 @app.route('/debug')
 @login_required
 def debug():
@@ -153,6 +1206,7 @@ def debug():
         'CLOUDINARY_API_SECRET': 'Set' if os.getenv('CLOUDINARY_API_SECRET') else 'Missing',
         'USERNAME': 'Set' if os.getenv('USERNAME') else 'Missing',
         'PASSWORD': 'Set' if os.getenv('PASSWORD') else 'Missing',
+        'PASSWORD_HASH': 'Set' if os.getenv('PASSWORD_HASH') else 'Missing',
         'SECRET_KEY': 'Set' if os.getenv('SECRET_KEY') else 'Missing'
     }
     return jsonify(debug_info)
@@ -0,0 +1,350 @@
+import json
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+try:
+    import boto3
+except ImportError:  # Only the S3 backend needs it
+    boto3 = None
+
+from media import VIDEO_FORMATS
+
+# What delete() reports for a public_id it found nothing under
+NOT_FOUND = 'not_found'
+
+
+def resource_type_of(filename):
+    return 'video' if filename.rsplit('.', 1)[-1].lower() in VIDEO_FORMATS else 'image'
+
+
+def split_filename(filename):
+    """(public_id, format) of a stored file name"""
+    public_id, _, fmt = filename.rpartition('.')
+    return (public_id, fmt) if public_id else (filename, '')
+
+
+class StorageBackend:
+    """Where the media bytes live
+
+    Every backend speaks in resource dicts shaped like Cloudinary's (public_id, format,
+    resource_type, created_at, bytes, width, height and ``context.custom`` metadata), so
+    MediaItem.from_resource reads them all the same way.
+    """
+
+    name = None
+    # Most public_ids one delete() call takes
+    batch_size = 100
+
+    def list(self, cursor=None, limit=500):
+        """One page of stored resources and the cursor of the next page (None at the end)"""
+        raise NotImplementedError
+
+    def list_all(self):
+        resources = []
+        cursor = None
+        while True:
+            page, cursor = self.list(cursor)
+            resources.extend(page)
+            if not cursor:
+                return resources
+
+    def put(self, path, filename, public_id, resource_type='image', metadata=None):
+        """Store the file at ``path`` under ``public_id``, streaming it from disk; returns its resource"""
+        raise NotImplementedError
+
+    def delete(self, items):
+        """Delete up to batch_size assets of one resource_type; returns {public_id: error message, or None when gone}
+
+        Items whose format is unknown (empty) are looked up by public_id. Backends that keep
+        each resource_type apart report NOT_FOUND when there was nothing of that type to delete.
+        """
+        raise NotImplementedError
+
+    def url(self, item):
+        """Delivery URL of the original"""
+        raise NotImplementedError
+
+    def open(self, item):
+        """The original's bytes as a binary file object, for reading a chunk at a time"""
+        raise NotImplementedError
+
+
+class CloudinaryBackend(StorageBackend):
+    """Cloudinary through a StorageClient, so every call gets its retries and rate-limit handling"""
+
+    name = 'cloudinary'
+    # The Admin API's limit for delete_resources
+    batch_size = 100
+
+    def __init__(self, client, derivatives, large_upload_threshold=20 * 1024 ** 2, chunk_size=20 * 1024 ** 2):
+        self.client = client
+        self.derivatives = derivatives
+        self.large_upload_threshold = large_upload_threshold
+        self.chunk_size = chunk_size
+
+    def list(self, cursor=None, limit=500):
+        # Images are listed first, then videos; the cursor records which of the two it is in
+        resource_type, _, next_cursor = (cursor or 'image:').partition(':')
+        result = self.client.api.resources(type='upload', resource_type=resource_type, max_results=limit,
+                                           next_cursor=next_cursor or None, context=True)
+        if result.get('next_cursor'):
+            cursor = f"{resource_type}:{result['next_cursor']}"
+        else:
+            cursor = 'video:' if resource_type == 'image' else None
+        return result.get('resources', []), cursor
+
+    def upload_options(self, public_id, resource_type='image', metadata=None):
+        """Upload API options for a new asset, including eager renditions when configured"""
+        # The chunked API defaults to 'raw', so videos have to be named explicitly
+        options = {'public_id': public_id, 'resource_type': 'video' if resource_type == 'video' else 'auto'}
+        # Kept on the asset as context metadata so the manifest can be rebuilt from a re-listing
+        context = {key: value for key, value in (metadata or {}).items() if value}
+        if context:
+            # Encoded here rather than by the SDK so signed browser uploads post the same string;
+            # it escapes any '=' or '|' in a value (a filename, say)
+            options['context'] = self.client.utils.encode_context(context)
+        eager = self.derivatives.eager(resource_type)
+        if eager:
+            options.update(eager=eager, eager_async='true')
+        return options
+
+    def put(self, path, filename, public_id, resource_type='image', metadata=None):
+        options = self.upload_options(public_id, resource_type, metadata)
+        # Big files go up in chunk_size pieces, read from disk one chunk at a time
+        if os.path.getsize(path) > self.large_upload_threshold:
+            return self.client.uploader.upload_large(path, filename=filename, chunk_size=self.chunk_size, **options)
+        return self.client.uploader.upload(path, filename=filename, **options)
+
+    def delete(self, items):
+        public_ids = [item.public_id for item in items]
+        result = self.client.api.delete_resources(public_ids, resource_type=items[0].resource_type, type='upload')
+        deleted = result.get('deleted', {})
+        # A video deleted as an image comes back not_found; the caller decides whether that is gone
+        return {public_id: None if deleted.get(public_id) == 'deleted'
+                else deleted.get(public_id, 'not deleted') for public_id in public_ids}
+
+    def url(self, item):
+        return self.derivatives.original_url(item)
+
+    def open(self, item):
+        url = self.url(item) + (f'.{item.format}' if item.format else '')
+        response = self.client.http.request('GET', url, preload_content=False)
+        if response.status != 200:
+            response.release_conn()
+            raise IOError(f'{url} answered {response.status}')
+        return response
+
+
+class LocalBackend(StorageBackend):
+    """A directory on local disk, served by the app under ``base_url``
+
+    Metadata is kept in a JSON sidecar per file under ``.meta``, so a re-listing brings
+    it back just as Cloudinary's context does.
+    """
+
+    name = 'local'
+    batch_size = 1000
+
+    def __init__(self, root, base_url='/media'):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+        self.meta_root = os.path.join(root, '.meta')
+        os.makedirs(self.meta_root, exist_ok=True)
+
+    def _meta_path(self, filename):
+        return os.path.join(self.meta_root, f'{filename}.json')
+
+    def _resource(self, entry_name, stat, metadata=None):
+        public_id, fmt = split_filename(entry_name)
+        if metadata is None:
+            try:
+                with open(self._meta_path(entry_name)) as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                metadata = {}
+        return {
+            'public_id': public_id,
+            'format': fmt,
+            'resource_type': resource_type_of(entry_name),
+            'created_at': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            'bytes': stat.st_size,
+            'context': {'custom': metadata},
+        }
+
+    def list(self, cursor=None, limit=500):
+        # Paged by file name, so a page costs one scandir however deep into the listing it is
+        with os.scandir(self.root) as entries:
+            names = sorted(entry.name for entry in entries if entry.is_file() and not entry.name.startswith('.')
+                           and (cursor is None or entry.name > cursor))
+        page = names[:limit]
+        resources = []
+        for name in page:
+            try:
+                resources.append(self._resource(name, os.stat(os.path.join(self.root, name))))
+            except FileNotFoundError:  # Deleted since the scan
+                continue
+        return resources, page[-1] if len(names) > limit else None
+
+    def put(self, path, filename, public_id, resource_type='image', metadata=None):
+        stored_name = f"{public_id}.{filename.rsplit('.', 1)[-1].lower()}" if '.' in filename else public_id
+        target = os.path.join(self.root, stored_name)
+        metadata = {key: value for key, value in (metadata or {}).items() if value}
+        if metadata:
+            with open(self._meta_path(stored_name), 'w') as f:
+                json.dump(metadata, f)
+        # Copied to a temporary name first so a listing never sees a half-written file
+        temp_path = os.path.join(self.root, f'.{uuid.uuid4().hex}.tmp')
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, target)
+        return self._resource(stored_name, os.stat(target), metadata)
+
+    def _find(self, public_id):
+        """Stored file name of a public_id, whatever its extension"""
+        prefix = f'{public_id}.'
+        with os.scandir(self.root) as entries:
+            return next((entry.name for entry in entries if entry.name.startswith(prefix)), None)
+
+    def delete(self, items):
+        results = {}
+        for item in items:
+            name = item.filename if item.format else self._find(item.public_id)
+            try:
+                if name:
+                    os.remove(os.path.join(self.root, name))
+                    if os.path.exists(self._meta_path(name)):
+                        os.remove(self._meta_path(name))
+                results[item.public_id] = None
+            except FileNotFoundError:
+                results[item.public_id] = None
+            except OSError as e:
+                results[item.public_id] = str(e)
+        return results
+
+    def path(self, filename):
+        """Absolute path of a stored file, or None for names outside the storage root"""
+        path = os.path.abspath(os.path.join(self.root, filename))
+        return path if os.path.dirname(path) == os.path.abspath(self.root) else None
+
+    def url(self, item):
+        return f'{self.base_url}/{item.filename}'
+
+    def open(self, item):
+        name = item.filename if item.format else self._find(item.public_id)
+        if name is None:
+            raise FileNotFoundError(f'{item.public_id} is not stored')
+        return open(os.path.join(self.root, name), 'rb')
+
+
+class S3Backend(StorageBackend):
+    """An S3 bucket, or anything speaking the S3 API (MinIO, moto_server) via ``endpoint_url``
+
+    Object listings do not include user metadata, so assets re-listed from S3 carry no
+    content hash; the manifest keeps the one recorded at upload. Without a ``public_url``,
+    originals are served through presigned URLs valid for ``url_expiry`` seconds.
+    """
+
+    name = 's3'
+    # The most keys DeleteObjects takes
+    batch_size = 1000
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region_name=None, public_url=None, url_expiry=7 * 86400,
+                 **client_kwargs):
+        if boto3 is None:
+            raise RuntimeError('The S3 storage backend needs boto3 (pip install boto3)')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.url_expiry = url_expiry
+        self.s3 = boto3.client('s3', endpoint_url=endpoint_url, region_name=region_name, **client_kwargs)
+        self._urls = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv('S3_BUCKET_NAME'), prefix=os.getenv('S3_PREFIX', ''),
+                   endpoint_url=os.getenv('S3_ENDPOINT_URL') or None, region_name=os.getenv('S3_REGION') or None,
+                   public_url=os.getenv('S3_PUBLIC_URL') or None,
+                   url_expiry=int(os.getenv('S3_URL_EXPIRY', 7 * 86400)))
+
+    def _resource(self, key, size, last_modified, metadata=None):
+        filename = key[len(self.prefix):]
+        public_id, fmt = split_filename(filename)
+        return {
+            'public_id': public_id,
+            'format': fmt,
+            'resource_type': resource_type_of(filename),
+            'created_at': last_modified,
+            'bytes': size,
+            'context': {'custom': metadata or {}},
+        }
+
+    def list(self, cursor=None, limit=500):
+        options = {'Bucket': self.bucket, 'Prefix': self.prefix, 'MaxKeys': min(limit, 1000)}
+        if cursor:
+            options['ContinuationToken'] = cursor
+        result = self.s3.list_objects_v2(**options)
+        resources = [self._resource(obj['Key'], obj['Size'], obj['LastModified'])
+                     for obj in result.get('Contents', []) if '/' not in obj['Key'][len(self.prefix):]]
+        return resources, result.get('NextContinuationToken') if result.get('IsTruncated') else None
+
+    def put(self, path, filename, public_id, resource_type='image', metadata=None):
+        stored_name = f"{public_id}.{filename.rsplit('.', 1)[-1].lower()}" if '.' in filename else public_id
+        key = f'{self.prefix}{stored_name}'
+        metadata = {key: str(value) for key, value in (metadata or {}).items() if value}
+        # S3 user metadata travels in HTTP headers, which only carry ASCII
+        extra = {'Metadata': {key: quote(value) for key, value in metadata.items()}}
+        content_type = mimetypes.guess_type(stored_name)[0]
+        if content_type:
+            extra['ContentType'] = content_type
+        # upload_file streams from disk, switching to a multipart upload for big files
+        self.s3.upload_file(path, self.bucket, key, ExtraArgs=extra)
+        return self._resource(key, os.path.getsize(path), time.time(), metadata)
+
+    def _key(self, item):
+        if item.format:
+            return f'{self.prefix}{item.filename}'
+        # Format unknown: find the key by its public_id prefix
+        result = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=f'{self.prefix}{item.public_id}.', MaxKeys=1)
+        return next((obj['Key'] for obj in result.get('Contents', [])), None)
+
+    def delete(self, items):
+        keys = {item.public_id: self._key(item) for item in items}
+        for key in keys.values():
+            self._urls.pop(key, None)
+        results = {public_id: None for public_id in keys}
+        objects = [{'Key': key} for key in keys.values() if key]
+        if not objects:
+            return results
+        result = self.s3.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+        by_key = {key: public_id for public_id, key in keys.items()}
+        for error in result.get('Errors', []):
+            results[by_key.get(error['Key'], error['Key'])] = error.get('Message') or error.get('Code')
+        return results
+
+    def url(self, item):
+        key = f'{self.prefix}{item.filename}'
+        if self.public_url:
+            return f'{self.public_url}/{key}'
+        # Signing costs about a millisecond and a gallery page needs hundreds of URLs, so each one
+        # is reused for the first half of its lifetime
+        cached = self._urls.get(key)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        url = self.s3.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': key},
+                                             ExpiresIn=self.url_expiry)
+        self._urls[key] = (url, time.time() + self.url_expiry / 2)
+        return url
+
+    def open(self, item):
+        # FileNotFoundError for a missing object, as LocalBackend raises
+        key = self._key(item)
+        if key is None:
+            raise FileNotFoundError(f'{item.public_id} is not stored')
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)['Body']
+        except self.s3.exceptions.NoSuchKey:
+            raise FileNotFoundError(f'{item.public_id} is not stored')
@@ -0,0 +1,310 @@
+"""Load test of the gallery, upload and delete routes against a local Cloudinary stand-in
+
+Drives /, /api/media, /upload and /delete/<filename> through Flask's test client and through
+api/index.py's handler (the Vercel entry point), with benchmarks/fake_cloudinary.py in place of
+the SDK: a synthetic catalog and a fixed simulated round trip per Cloudinary call. Reports
+p50/p95/p99 latency, throughput and peak RSS per scenario. Run from the repository root:
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --catalog 100000 --latency-ms 80 --requests 500 --concurrency 8
+    python benchmarks/bench_load.py --json load.jsonl
+    python benchmarks/bench_load.py --backend local
+    S3_ENDPOINT_URL=http://localhost:5001 S3_BUCKET_NAME=bench python benchmarks/bench_load.py --backend s3
+
+--backend runs the same workload against another storage backend instead of the stand-in: the
+catalog is first written to a temporary directory (local) or to the bucket (s3, which should point
+at a local S3 server such as moto_server or MinIO), and --latency-ms does not apply.
+--json appends one line per invocation (with the git commit) so runs can be compared across commits.
+Jobs run inline (JOB_WORKERS=0) unless --job-workers is given, so upload and delete latencies
+include the Cloudinary work rather than just queueing it.
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ('first_sync', 'index', 'index_304', 'api_media', 'upload', 'delete')
+USERNAME, PASSWORD = 'bench', 'bench'
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class TestClientDriver:
+    """Requests through app.test_client(), one logged-in client per thread"""
+
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+        self.cookie = None
+        client = app.test_client()
+        client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+        self.cookie = client.get_cookie('session').value
+
+    def request(self, method, path, headers=None, data=None, content_type=None):
+        client = self.app.test_client()
+        client.set_cookie('session', self.cookie)
+        response = client.open(path, method=method, headers=headers or {}, data=data, content_type=content_type)
+        # Keep the session current like a browser would, so consumed flash messages stay consumed
+        cookie = client.get_cookie('session')
+        if cookie is not None:
+            self.cookie = cookie.value
+        return response.status_code, dict(response.headers)
+
+
+class HandlerDriver:
+    """Requests as Vercel proxy events through api/index.py's handler"""
+
+    name = 'handler'
+
+    def __init__(self, handler):
+        self.handler = handler
+        response = handler({'httpMethod': 'POST', 'path': '/login',
+                            'headers': {'content-type': 'application/x-www-form-urlencoded'},
+                            'body': f'username={USERNAME}&password={PASSWORD}'}, None)
+        self.cookie = response['headers']['Set-Cookie'].split(';', 1)[0]
+
+    def request(self, method, path, headers=None, data=None, content_type=None):
+        path, _, query = path.partition('?')
+        params = dict(pair.split('=', 1) for pair in query.split('&') if pair)
+        event = {'httpMethod': method, 'path': path, 'queryStringParameters': params,
+                 'headers': dict(headers or {}, cookie=self.cookie)}
+        if content_type:
+            event['headers']['content-type'] = content_type
+        if data is not None:
+            event['body'] = base64.b64encode(data).decode()
+            event['isBase64Encoded'] = True
+        response = self.handler(event, None)
+        for header in response['multiValueHeaders'].get('Set-Cookie', []):
+            if header.startswith('session='):
+                self.cookie = header.split(';', 1)[0]
+        return response['statusCode'], response['headers']
+
+
+def multipart(filename, payload):
+    from werkzeug.datastructures import FileStorage
+    from werkzeug.test import encode_multipart
+    import io
+    boundary, body = encode_multipart({'file': FileStorage(io.BytesIO(payload), filename)})
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def run_scenario(driver, scenario, args, fake, state):
+    """Issue the scenario's requests and return their latencies in seconds"""
+    json_accept = {'Accept': 'application/json'}
+
+    if scenario == 'first_sync':
+        # Empty manifest: the first page view blocks on listing the whole catalog
+        requests = [('GET', '/', {}, None, None)]
+    elif scenario == 'index':
+        requests = [('GET', '/', {}, None, None)] * args.requests
+    elif scenario == 'index_304':
+        _, headers = driver.request('GET', '/')
+        requests = [('GET', '/', {'If-None-Match': headers.get('ETag', '')}, None, None)] * args.requests
+    elif scenario == 'api_media':
+        requests = []
+        cursor = ''
+        for _ in range(args.requests):
+            requests.append(('GET', f'/api/media?cursor={cursor}', {}, None, None))
+            cursor = state['cursors'].pop(0) if state['cursors'] else ''
+    elif scenario == 'upload':
+        requests = []
+        for i in range(args.requests):
+            # Unique bytes per request so deduplication never short-circuits the upload
+            body, content_type = multipart(f'bench_{i}.jpg', os.urandom(args.upload_bytes))
+            requests.append(('POST', '/upload', json_accept, body, content_type))
+    elif scenario == 'delete':
+        filenames = state['deletable'][:args.requests]
+        del state['deletable'][:args.requests]
+        requests = [('POST', f'/delete/{filename}', json_accept, None, None) for filename in filenames]
+
+    def timed(request):
+        method, path, headers, data, content_type = request
+        started = time.perf_counter()
+        status, _ = driver.request(method, path, headers, data, content_type)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1 if scenario == 'first_sync' else args.concurrency) as pool:
+        results = list(pool.map(timed, requests))
+    elapsed = time.perf_counter() - started
+    return [latency for latency, _ in results], [status for _, status in results], elapsed
+
+
+def page_cursors(manifest, page_size, pages):
+    """Cursors of the first pages of the listing, for walking /api/media"""
+    cursors = []
+    cursor = None
+    for _ in range(pages):
+        _, cursor = manifest.page(cursor, limit=page_size)
+        if not cursor:
+            break
+        cursors.append(cursor)
+    return cursors
+
+
+def seed_catalog(storage, size):
+    """Store ``size`` small files (one in ten a video) and return their file names"""
+    import random
+    source = os.path.join(tempfile.mkdtemp(prefix='bench-load-'), 'seed')
+    with open(source, 'wb') as f:
+        f.write(os.urandom(1024))
+
+    def put(i):
+        filename = f'photo{i}.mp4' if random.random() < 0.1 else f'photo{i}.jpg'
+        resource = storage.put(source, filename, f'seed{i:07d}', 'video' if filename.endswith('.mp4') else 'image')
+        return f"{resource['public_id']}.{resource['format']}"
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        return list(pool.map(put, range(size)))
+
+
+def run(args, via):
+    """One driver in this process, from an empty manifest; returns the per-scenario rows"""
+    fake = None
+    if args.backend == 'cloudinary':
+        from fake_cloudinary import FakeCloudinary
+        fake = FakeCloudinary(args.catalog, args.latency_ms, args.jitter_ms).install()
+
+    # The app reads its configuration at import time
+    os.environ.update({
+        'USERNAME': USERNAME,
+        'PASSWORD': PASSWORD,
+        'SECRET_KEY': 'bench',
+        'CLOUDINARY_CLOUD_NAME': 'bench',
+        'CLOUDINARY_API_KEY': 'bench',
+        'CLOUDINARY_API_SECRET': 'bench',
+        'MANIFEST_PATH': os.path.join(tempfile.mkdtemp(prefix='bench-load-'), 'manifest.db'),
+        'MANIFEST_SYNC_INTERVAL': '0',
+        'JOB_WORKERS': str(args.job_workers),
+        'DIRECT_UPLOADS': 'false',
+        'STORAGE_BACKEND': args.backend,
+        'LOCAL_STORAGE_PATH': tempfile.mkdtemp(prefix='bench-load-'),
+    })
+    if via == 'handler':
+        from api.index import handler
+        import app as app_module
+        driver = HandlerDriver(handler)
+    else:
+        import app as app_module
+        driver = TestClientDriver(app_module.app)
+
+    rows = []
+    filenames = fake.filenames() if fake else seed_catalog(app_module.storage_backend(), args.catalog)
+    state = {'deletable': filenames, 'cursors': []}
+    for scenario in [name for name in args.scenarios.split(',') if name]:
+        if scenario == 'api_media' and not state['cursors']:
+            state['cursors'] = page_cursors(app_module.manifest, app_module.GALLERY_PAGE_SIZE, args.requests)
+        latencies, statuses, elapsed = run_scenario(driver, scenario, args, fake, state)
+        if not latencies:
+            continue
+        row = {
+            'backend': args.backend,
+            'via': via,
+            'scenario': scenario,
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'peak_rss_mb': peak_rss_mb(),
+            'errors': sum(status >= 400 for status in statuses),
+        }
+        rows.append(row)
+        print(f"{via:<12} {scenario:<11} {row['requests']:>5} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+              f"{row['p99_ms']:>9.2f} {row['throughput_rps']:>9.1f} {row['peak_rss_mb']:>8.1f}  {row['errors'] or ''}",
+              flush=True)
+    return rows, fake.calls if fake else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--catalog', type=int, default=10000, help='assets in the fake Cloudinary account')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='simulated round trip per Cloudinary call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--upload-bytes', type=int, default=256 * 1024)
+    parser.add_argument('--job-workers', type=int, default=0)
+    parser.add_argument('--backend', choices=('cloudinary', 'local', 's3'), default='cloudinary',
+                        help='storage backend; cloudinary uses the in-process stand-in')
+    parser.add_argument('--via', choices=('test_client', 'handler', 'both'), default='both')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--json', metavar='PATH', help='append a JSON summary line to this file')
+    # Internal: each driver runs in its own interpreter so state and peak RSS do not carry over
+    parser.add_argument('--rows-to', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rows_to:
+        rows, calls = run(args, args.via)
+        with open(args.rows_to, 'w') as f:
+            json.dump({'rows': rows, 'calls': calls}, f)
+        return
+
+    latency = f', latency {args.latency_ms}ms' if args.backend == 'cloudinary' else ''
+    print(f'{args.backend}: catalog {args.catalog}{latency}, {args.requests} requests/scenario, '
+          f'concurrency {args.concurrency}')
+    print(f"{'via':<12} {'scenario':<11} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} "
+          f"{'peak MB':>8}  errors")
+    report = []
+    calls = {}
+    for via in (('test_client', 'handler') if args.via == 'both' else (args.via,)):
+        rows_path = os.path.join(tempfile.mkdtemp(prefix='bench-load-'), 'rows.json')
+        child = [arg for arg in sys.argv[1:] if not arg.startswith('--via')]
+        if '--via' in sys.argv:
+            position = sys.argv.index('--via')
+            child = sys.argv[1:position] + sys.argv[position + 2:]
+        subprocess.run([sys.executable, os.path.abspath(__file__), *child, '--via', via, '--rows-to', rows_path],
+                       cwd=ROOT, check=True)
+        with open(rows_path) as f:
+            result = json.load(f)
+        report.extend(result['rows'])
+        calls[via] = result['calls']
+
+    if args.backend == 'cloudinary':
+        print(f'\ncloudinary calls: {calls}')
+    if args.json:
+        with open(args.json, 'a') as f:
+            f.write(json.dumps({
+                'commit': git_commit(),
+                'backend': args.backend,
+                'catalog': args.catalog,
+                'latency_ms': args.latency_ms,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'job_workers': args.job_workers,
+                'results': report,
+                'cloudinary_calls': calls,
+            }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark: the old quadratic created_at sort in index() vs MediaItem records
+
+Run from the repository root:
+
+    python benchmarks/bench_media_sort.py
+    python benchmarks/bench_media_sort.py --sizes 500 5000 50000 --legacy-max 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media import MediaItem, sort_media
+
+
+def make_resources(count, seed=0):
+    """Synthetic Cloudinary listing with shuffled created_at values"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    resources = []
+    for i in range(count):
+        created = start + timedelta(seconds=rng.randrange(5 * 365 * 24 * 3600))
+        video = rng.random() < 0.1
+        resources.append({
+            'public_id': f'{i:032x}_memory',
+            'format': 'mp4' if video else 'jpg',
+            'resource_type': 'video' if video else 'image',
+            'created_at': created.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'bytes': rng.randrange(100_000, 15_000_000),
+            'width': 4032,
+            'height': 3024,
+        })
+    return resources
+
+
+def legacy_sort(resources):
+    """The pre-MediaItem index() sort: a full scan of the listing per sort key"""
+    return sorted([resource['public_id'] + '.' + resource['format'] for resource in resources],
+                  key=lambda x: next((r['created_at'] for r in resources if r['public_id'] + '.' + r['format'] == x), ''),
+                  reverse=True)
+
+
+def record_sort(resources):
+    """Build MediaItem records once, then sort them in a single pass"""
+    return sort_media([MediaItem.from_resource(resource) for resource in resources])
+
+
+def best_of(func, arg, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 50000])
+    parser.add_argument('--legacy-max', type=int, default=5000,
+                        help='skip the quadratic sort above this many items (it takes minutes at 50k)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'items':>8}  {'legacy':>12}  {'MediaItem':>12}  {'speedup':>8}")
+    for size in args.sizes:
+        resources = make_resources(size)
+        assert [item.filename for item in record_sort(resources[:200])] == legacy_sort(resources[:200])
+        new = best_of(record_sort, resources, args.repeat)
+        if size <= args.legacy_max:
+            old = best_of(legacy_sort, resources, 1)
+            print(f'{size:>8}  {old * 1000:>10.1f}ms  {new * 1000:>10.1f}ms  {old / new:>7.0f}x')
+        else:
+            print(f"{size:>8}  {'skipped':>12}  {new * 1000:>10.1f}ms  {'-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Cold-start time of the Vercel entry point (api/index.py), measured with python -X importtime
+
+Each run is a fresh interpreter, like a serverless cold start. Run from the repository root:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 20 --top 15 --json startup.jsonl
+
+--json appends one line per invocation (with the git commit) so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_ENTRY_POINT = 'import api.index'
+
+
+def run_once(env):
+    """Wall time of one cold import plus the per-module importtime report"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_ENTRY_POINT],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    modules = {}
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        modules[name.strip()] = int(cumulative_us)
+    return elapsed, modules
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    parser.add_argument('--json', metavar='PATH', help='append a JSON summary line to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('MANIFEST_PATH', os.path.join(tempfile.mkdtemp(), 'manifest.db'))
+    env.setdefault('MANIFEST_SYNC_INTERVAL', '0')
+
+    walls = []
+    samples = {}
+    for _ in range(args.runs):
+        wall, modules = run_once(env)
+        walls.append(wall)
+        for name, cumulative in modules.items():
+            samples.setdefault(name, []).append(cumulative)
+    medians = {name: statistics.median(values) for name, values in samples.items()}
+
+    print(f'{IMPORT_ENTRY_POINT!r} over {args.runs} fresh interpreters')
+    print(f'  wall time (incl. interpreter start): median {statistics.median(walls) * 1000:.1f}ms, '
+          f'min {min(walls) * 1000:.1f}ms, max {max(walls) * 1000:.1f}ms')
+    print(f'  api.index import (cumulative):       median {medians.get("api.index", 0) / 1000:.1f}ms')
+    print('\n  slowest imports (median cumulative):')
+    top_level = {name: us for name, us in medians.items() if name != 'api.index' and '.' not in name}
+    for name, us in sorted(top_level.items(), key=lambda entry: entry[1], reverse=True)[:args.top]:
+        print(f'    {us / 1000:8.1f}ms  {name}')
+    print(f"\n  cloudinary imported at startup: {'yes' if 'cloudinary' in medians else 'no'}")
+
+    if args.json:
+        with open(args.json, 'a') as f:
+            f.write(json.dumps({
+                'commit': git_commit(),
+                'runs': args.runs,
+                'wall_ms_median': round(statistics.median(walls) * 1000, 2),
+                'import_ms_median': round(medians.get('api.index', 0) / 1000, 2),
+                'top_imports_ms': {name: round(us / 1000, 2) for name, us in
+                                   sorted(top_level.items(), key=lambda entry: entry[1], reverse=True)[:args.top]},
+            }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
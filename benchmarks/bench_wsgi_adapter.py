@@ -0,0 +1,116 @@
+"""Per-invocation overhead of the api/index.py WSGI adapter vs the original string-based one
+
+Both adapters drive the same trivial WSGI app, so the numbers are adapter cost only.
+Run from the repository root:
+
+    python benchmarks/bench_wsgi_adapter.py
+    python benchmarks/bench_wsgi_adapter.py --iterations 20000
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Importing api/index.py imports the app; keep it off the network
+os.environ.setdefault('MANIFEST_PATH', os.path.join(tempfile.mkdtemp(), 'manifest.db'))
+os.environ.setdefault('MANIFEST_SYNC_INTERVAL', '0')
+
+from api.index import run_wsgi  # noqa: E402
+
+
+def legacy_handler(app, event):
+    """The adapter as it was before the rewrite (text bodies only)"""
+    environ = {
+        'REQUEST_METHOD': event.get('httpMethod', 'GET'),
+        'SCRIPT_NAME': '',
+        'PATH_INFO': event.get('path', '/'),
+        'QUERY_STRING': event.get('queryStringParameters', {}) and '&'.join([f"{k}={v}" for k, v in event.get('queryStringParameters', {}).items()]) or '',
+        'CONTENT_TYPE': event.get('headers', {}).get('content-type', ''),
+        'CONTENT_LENGTH': str(len(event.get('body', ''))),
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '443',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'https',
+        'wsgi.input': event.get('body', ''),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for header_name, header_value in event.get('headers', {}).items():
+        environ[f'HTTP_{header_name.upper().replace("-", "_")}'] = header_value
+    response_data = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_data['status'] = status
+        response_data['headers'] = headers
+
+    response_body = app(environ, start_response)
+    status_code = int(response_data['status'].split()[0])
+    headers = dict(response_data['headers'])
+    if isinstance(response_body, list):
+        body = b''.join(response_body).decode('utf-8')
+    else:
+        body = response_body
+    return {'statusCode': status_code, 'headers': headers, 'body': body}
+
+
+def make_app(response_body, content_type):
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', content_type), ('Content-Length', str(len(response_body)))])
+        return [response_body]
+    return app
+
+
+def make_event(body=b'', binary=False):
+    event = {
+        'httpMethod': 'POST' if body else 'GET',
+        'path': '/api/media',
+        'queryStringParameters': {'limit': '60', 'cursor': 'abc'},
+        'headers': {'host': 'example.com', 'accept': 'application/json', 'content-type': 'application/octet-stream',
+                    'cookie': 'session=' + 'x' * 200},
+    }
+    if binary:
+        event['body'] = base64.b64encode(body).decode('ascii')
+        event['isBase64Encoded'] = True
+    else:
+        event['body'] = body.decode('latin-1')
+    return event
+
+
+def per_call_us(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    cases = [
+        ('GET, 2 KB JSON response', b'', b'{"items": []}' + b' ' * 2048, 'application/json'),
+        ('POST 1 MB body, 2 KB response', b'x' * 1024 ** 2, b'ok' * 1024, 'text/plain'),
+        ('GET, 1 MB JSON response', b'', b'[' + b'0,' * (512 * 1024) + b'0]', 'application/json'),
+    ]
+    print(f"{'case':<32}  {'legacy':>10}  {'new':>10}  {'new (base64 in)':>16}")
+    for name, request_body, response_body, content_type in cases:
+        app = make_app(response_body, content_type)
+        text_event = make_event(request_body)
+        binary_event = make_event(request_body, binary=True)
+        iterations = args.iterations if len(request_body) + len(response_body) < 64 * 1024 else args.iterations // 50
+        legacy = per_call_us(lambda: legacy_handler(app, text_event), iterations)
+        new = per_call_us(lambda: run_wsgi(app, text_event), iterations)
+        new_binary = per_call_us(lambda: run_wsgi(app, binary_event), iterations)
+        print(f'{name:<32}  {legacy:>8.1f}us  {new:>8.1f}us  {new_binary:>14.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""In-process stand-in for the parts of the Cloudinary SDK the app calls
+
+install() swaps cloudinary.api / cloudinary.uploader functions for methods of a FakeCloudinary
+holding a synthetic catalog, with a configurable per-call latency. Nothing touches the network,
+so benchmarks need no credentials and results depend only on the code under test.
+"""
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import cloudinary.api
+import cloudinary.uploader
+
+VIDEO_SHARE = 0.1
+PAGE_LIMIT = 500
+
+
+class FakeCloudinary:
+    def __init__(self, catalog_size=10000, latency_ms=50.0, jitter_ms=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.resources = {'image': {}, 'video': {}}
+        self._listings = {}
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        for i in range(catalog_size):
+            resource_type = 'video' if self.random.random() < VIDEO_SHARE else 'image'
+            self._add({
+                'public_id': f'{uuid.UUID(int=self.random.getrandbits(128)).hex}_photo{i}',
+                'format': 'mp4' if resource_type == 'video' else 'jpg',
+                'resource_type': resource_type,
+                'type': 'upload',
+                'created_at': (start + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'bytes': self.random.randint(500_000, 15_000_000),
+                'width': 4032,
+                'height': 3024,
+            })
+
+    def _add(self, resource):
+        self.resources[resource['resource_type']][resource['public_id']] = resource
+        self._listings.pop(resource['resource_type'], None)
+
+    def _remove(self, resource_type, public_id):
+        self._listings.pop(resource_type, None)
+        return self.resources.get(resource_type, {}).pop(public_id, None)
+
+    def _listing(self, resource_type):
+        """Newest first, sorted once per change rather than once per page"""
+        with self.lock:
+            if resource_type not in self._listings:
+                self._listings[resource_type] = sorted(self.resources.get(resource_type, {}).values(),
+                                                       key=lambda r: r['created_at'], reverse=True)
+            return self._listings[resource_type]
+
+    def _call(self, name):
+        """Count the call and sleep for the simulated round trip"""
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def filenames(self):
+        return [f"{r['public_id']}.{r['format']}" for kind in self.resources.values() for r in kind.values()]
+
+    # cloudinary.api
+
+    def api_resources(self, resource_type='image', max_results=10, next_cursor=None, **options):
+        self._call('api.resources')
+        listing = self._listing(resource_type)
+        offset = int(next_cursor or 0)
+        limit = min(max_results, PAGE_LIMIT)
+        page = listing[offset:offset + limit]
+        result = {'resources': page}
+        if offset + limit < len(listing):
+            result['next_cursor'] = str(offset + limit)
+        return result
+
+    def api_delete_resources(self, public_ids, resource_type='image', **options):
+        self._call('api.delete_resources')
+        deleted = {}
+        with self.lock:
+            for public_id in public_ids:
+                found = self._remove(resource_type, public_id)
+                deleted[public_id] = 'deleted' if found else 'not_found'
+        return {'deleted': deleted}
+
+    # cloudinary.uploader
+
+    def _store(self, file, options):
+        # Read the payload like the real SDK would, so request size still costs something
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                size = len(f.read())
+        else:
+            size = len(file.read())
+        resource_type = options.get('resource_type') if options.get('resource_type') in ('image', 'video') else 'image'
+        context = dict(pair.split('=', 1) for pair in options['context'].split('|')) if options.get('context') else {}
+        resource = {
+            'public_id': options.get('public_id') or uuid.uuid4().hex,
+            'format': 'mp4' if resource_type == 'video' else 'jpg',
+            'resource_type': resource_type,
+            'type': 'upload',
+            'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'bytes': size,
+            'width': 4032,
+            'height': 3024,
+            'context': {'custom': context},
+        }
+        with self.lock:
+            self._add(resource)
+        return dict(resource)
+
+    def uploader_upload(self, file, **options):
+        self._call('uploader.upload')
+        return self._store(file, options)
+
+    def uploader_upload_large(self, file, **options):
+        self._call('uploader.upload_large')
+        return self._store(file, options)
+
+    def uploader_destroy(self, public_id, resource_type='image', **options):
+        self._call('uploader.destroy')
+        with self.lock:
+            found = self._remove(resource_type, public_id)
+        return {'result': 'ok' if found else 'not found'}
+
+    def install(self):
+        """Patch the SDK modules in place; the app looks these up at call time"""
+        cloudinary.api.resources = self.api_resources
+        cloudinary.api.delete_resources = self.api_delete_resources
+        cloudinary.uploader.upload = self.uploader_upload
+        cloudinary.uploader.upload_large = self.uploader_upload_large
+        cloudinary.uploader.destroy = self.uploader_destroy
+        return self
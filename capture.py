@@ -0,0 +1,72 @@
+import struct
+from datetime import datetime, timedelta
+
+from optimize import Image, capture_date as image_capture_date
+
+
+# QuickTime and MP4 timestamps count seconds from 1904-01-01 UTC
+MP4_EPOCH = datetime(1904, 1, 1)
+MP4_EXTENSIONS = {'mp4', 'mov', 'm4v', '3gp'}
+# Containers only nest a few levels deep; this bounds the walk on a damaged file
+MAX_BOXES = 1000
+
+
+def _boxes(f, end):
+    """(type, body offset, body end) of each box from the current position up to ``end``"""
+    for _ in range(MAX_BOXES):
+        start = f.tell()
+        header = f.read(8)
+        if len(header) < 8 or start >= end:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+        elif size == 0:  # Box runs to the end of the file
+            size = end - start
+        if size < 8:
+            return
+        yield kind, f.tell(), start + size
+        f.seek(start + size)
+
+
+def video_capture_date(path):
+    """Creation time from an MP4/QuickTime movie header as an ISO string, or None
+
+    Only the box headers on the way to moov/mvhd are read, so this costs a few small reads
+    however large the video is.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            file_end = f.tell()
+            f.seek(0)
+            for kind, body, box_end in _boxes(f, file_end):
+                if kind != b'moov':
+                    continue
+                f.seek(body)
+                for child, child_body, _ in _boxes(f, box_end):
+                    if child != b'mvhd':
+                        continue
+                    f.seek(child_body)
+                    version = f.read(4)[0]
+                    seconds = struct.unpack('>Q' if version == 1 else '>I', f.read(8 if version == 1 else 4))[0]
+                    # Zero means the recorder did not set it
+                    return (MP4_EPOCH + timedelta(seconds=seconds)).isoformat() if seconds else None
+                return None
+    except (OSError, struct.error, IndexError, OverflowError):
+        return None
+    return None
+
+
+def capture_date(path):
+    """When a photo (EXIF) or MP4/MOV video (movie header) was taken, as an ISO string, or None"""
+    ext = path.rsplit('.', 1)[-1].lower()
+    if ext in MP4_EXTENSIONS:
+        return video_capture_date(path)
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image_capture_date(image)
+    except Exception:
+        return None
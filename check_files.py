@@ -1,22 +1,16 @@
-import os
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.api
+from storage import StorageClient
 
 # Load environment variables
 load_dotenv()
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+# Configure Cloudinary, with the app's retries and rate-limit handling
+storage = StorageClient.from_env()
 
 def check_cloudinary_files():
     try:
         # Get all resources
-        result = cloudinary.api.resources(type='upload', max_results=50)
+        result = storage.api.resources(type='upload', max_results=50)
         resources = result.get('resources', [])
 
         print(f"Total files in Cloudinary: {len(resources)}")
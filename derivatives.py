@@ -0,0 +1,115 @@
+# Crop/resize step of each rendition the gallery uses
+RENDITIONS = {
+    'grid': 'c_fill,g_auto,w_400,h_400',
+    'grid_2x': 'c_fill,g_auto,w_800,h_800',
+    'lightbox': 'c_limit,w_1600,h_1600',
+}
+
+# Grid renditions of a video are JPEG poster frames; so_auto lets Cloudinary pick a representative frame
+POSTER_RENDITIONS = ('grid', 'grid_2x')
+POSTER_FORMAT = 'jpg'
+
+
+class CloudinaryDerivatives:
+    """Builds delivery URLs for each rendition without touching the SDK or the network"""
+
+    def __init__(self, cloud_name, image_format='auto', quality='auto', eager=False):
+        self.cloud_name = cloud_name
+        self.image_format = image_format
+        self.quality = quality
+        self.eager_enabled = eager
+
+    def transformation(self, rendition):
+        return f'{RENDITIONS[rendition]},f_{self.image_format},q_{self.quality}'
+
+    def _base(self, item):
+        resource_type = 'video' if item.is_video else 'image'
+        return f'https://res.cloudinary.com/{self.cloud_name}/{resource_type}/upload'
+
+    def original_url(self, item):
+        return f'{self._base(item)}/{item.public_id}'
+
+    def poster_transformation(self, rendition):
+        return f'so_auto,{RENDITIONS[rendition]},q_{self.quality}'
+
+    def poster_url(self, item, rendition='grid'):
+        """Still frame of a video, cut and cached by Cloudinary like any other derivative"""
+        return f'{self._base(item)}/{self.poster_transformation(rendition)}/{item.public_id}.{POSTER_FORMAT}'
+
+    def url(self, item, rendition):
+        """URL of one rendition: poster frames for video tiles, otherwise the original video"""
+        if item.is_video:
+            if rendition in POSTER_RENDITIONS:
+                return self.poster_url(item, rendition)
+            return self.original_url(item)
+        return f'{self._base(item)}/{self.transformation(rendition)}/{item.public_id}'
+
+    def download_url(self, item):
+        """The untouched original, served as an attachment"""
+        return f'{self._base(item)}/fl_attachment/{item.public_id}.{item.format}'
+
+    def hash_source_url(self, item):
+        """A tiny squashed PNG of a photo, all a perceptual hash needs, for uploads that bypassed the app"""
+        return f'{self._base(item)}/c_scale,w_64,h_64/{item.public_id}.png'
+
+    def urls(self, item):
+        return {
+            'url': self.original_url(item),
+            'thumb_url': self.url(item, 'grid'),
+            'thumb_url_2x': self.url(item, 'grid_2x'),
+            'full_url': self.url(item, 'lightbox'),
+            'download_url': self.download_url(item),
+        }
+
+    def eager(self, resource_type='image'):
+        """Eager transformation string for an upload, or None to generate renditions on first view
+
+        Video posters are always generated up front so no tile ever waits on a frame grab.
+        Cloudinary cannot eagerly generate f_auto renditions (the format depends on the
+        requesting browser), so eager image renditions need a fixed image format.
+        """
+        if resource_type == 'video':
+            return '|'.join(f'{self.poster_transformation(rendition)}/{POSTER_FORMAT}' for rendition in POSTER_RENDITIONS)
+        if not self.eager_enabled or self.image_format == 'auto':
+            return None
+        return '|'.join(self.transformation(rendition) for rendition in RENDITIONS)
+
+
+class OriginalDerivatives:
+    """Renditions for storage that cannot resize on delivery (local disk, S3)
+
+    Every image rendition is the original itself; video tiles show a placeholder poster
+    and the lightbox plays the original.
+    """
+
+    image_format = 'original'
+    quality = 'original'
+    eager_enabled = False
+
+    def __init__(self, original_url, poster_placeholder):
+        # original_url(item) comes from the storage backend, which is only built on first use
+        self.original_url = original_url
+        self.poster_placeholder = poster_placeholder
+
+    def poster_url(self, item, rendition='grid'):
+        return self.poster_placeholder
+
+    def url(self, item, rendition):
+        if item.is_video and rendition in POSTER_RENDITIONS:
+            return self.poster_url(item, rendition)
+        return self.original_url(item)
+
+    def download_url(self, item):
+        return self.original_url(item)
+
+    def urls(self, item):
+        return {
+            'url': self.original_url(item),
+            'thumb_url': self.url(item, 'grid'),
+            'thumb_url_2x': self.url(item, 'grid_2x'),
+            'full_url': self.url(item, 'lightbox'),
+            'download_url': self.download_url(item),
+        }
+
+    def eager(self, resource_type='image'):
+        return None
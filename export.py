@@ -0,0 +1,148 @@
+# Streaming ZIP archives of stored media. Kept identical in the root app and in web/,
+# which are deployed separately.
+import queue
+import re
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 256 * 1024
+# Chunks read ahead per file; with ``prefetch`` files in flight this bounds the memory in use
+BUFFER_CHUNKS = 8
+
+# Upload names carry a uuid4 hex prefix to keep them unique; archives use the name as uploaded
+UNIQUE_PREFIX = re.compile(r'^[0-9a-f]{32}_')
+
+_DONE = object()
+
+
+class ExportEntry:
+    """One file of an archive: ``open()`` returns a binary file object, read a chunk at a time"""
+
+    __slots__ = ('name', 'open', 'date_time', 'size')
+
+    def __init__(self, name, open, date_time=None, size=None):
+        self.name = name
+        self.open = open
+        self.date_time = date_time
+        self.size = size
+
+
+def archive_names(filenames):
+    """Names as uploaded, with ' (2)', ' (3)'... added where two files would collide"""
+    used = set()
+    for filename in filenames:
+        name = UNIQUE_PREFIX.sub('', filename) or filename
+        stem, dot, ext = name.rpartition('.')
+        if not stem:
+            stem, dot, ext = name, '', ''
+        candidate, count = name, 1
+        while candidate.lower() in used:
+            count += 1
+            candidate = f'{stem} ({count}){dot}{ext}'
+        used.add(candidate.lower())
+        yield candidate
+
+
+class _Sink:
+    """Write-only file object that hands what ZipFile writes to the response generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def _fetch(entry, buffer, cancelled):
+    """Read one file into its bounded buffer; blocks while the buffer is full"""
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        f = entry.open()
+        try:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk or not put(chunk):
+                    break
+        finally:
+            f.close()
+    except Exception as e:
+        put(e)
+        return
+    put(_DONE)
+
+
+def stream_zip(entries, prefetch=4):
+    """Yield a ZIP archive of ``entries`` as it is written
+
+    Media is already compressed, so files are stored as they are (ZIP_STORED). Up to
+    ``prefetch`` files are read ahead on worker threads into buffers of BUFFER_CHUNKS
+    chunks, so memory stays at about prefetch * BUFFER_CHUNKS * CHUNK_SIZE however large
+    the archive gets; ZIP64 records take over past 4 GiB. Files that cannot be read are
+    listed in an export-errors.txt at the end of the archive rather than ending the download.
+    """
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+    cancelled = threading.Event()
+    errors = []
+    entries = iter(entries)
+    pending = deque()
+
+    def fill(pool):
+        while len(pending) < prefetch:
+            entry = next(entries, None)
+            if entry is None:
+                return
+            buffer = queue.Queue(maxsize=BUFFER_CHUNKS)
+            pool.submit(_fetch, entry, buffer, cancelled)
+            pending.append((entry, buffer))
+
+    pool = ThreadPoolExecutor(max_workers=prefetch)
+    try:
+        fill(pool)
+        while pending:
+            entry, buffer = pending.popleft()
+            fill(pool)
+            item = buffer.get()
+            if isinstance(item, Exception):
+                # Nothing of it was read, so it is left out of the archive
+                errors.append(f'{entry.name}: {item}')
+                continue
+            info = zipfile.ZipInfo(entry.name, date_time=entry.date_time or (1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            # Entries of unknown size get ZIP64 headers up front, since they may pass 4 GiB
+            force_zip64 = entry.size is None or entry.size >= zipfile.ZIP64_LIMIT
+            with archive.open(info, 'w', force_zip64=force_zip64) as member:
+                while item is not _DONE:
+                    if isinstance(item, Exception):
+                        errors.append(f'{entry.name}: {item} (file is incomplete)')
+                        break
+                    member.write(item)
+                    yield sink.drain()
+                    item = buffer.get()
+            yield sink.drain()
+        if errors:
+            archive.writestr('export-errors.txt', '\n'.join(errors) + '\n')
+        archive.close()
+        yield sink.drain()
+    finally:
+        # Also reached when the client disconnects and the generator is closed
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,253 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, created_at);
+"""
+
+# Columns added after the first release, added in place so queued jobs survive the upgrade
+LATER_COLUMNS = {'owner': 'TEXT', 'lease_until': 'REAL'}
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# A running job belongs to the process that claimed it for as long as that process keeps
+# renewing the lease; once it lapses (the process died or hung) the job is queued again
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 15
+
+
+class JobQueue:
+    """Persistent job table in SQLite, worked by a pool of in-process threads
+
+    Jobs are rows, so anything queued or interrupted by a restart is picked up again.
+    Several processes may share the file: each claim records its owner and a lease the
+    owner keeps renewing, and only jobs whose owner is gone are requeued. With
+    ``workers=0`` jobs run inline at enqueue time, which is what serverless deployments
+    need since nothing runs after the response is sent.
+    """
+
+    def __init__(self, path, workers=4, retention=86400, lease=LEASE_SECONDS, heartbeat=HEARTBEAT_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.retention = retention
+        self.lease = lease
+        self.heartbeat = heartbeat
+        # host:pid:token; the token tells this process from an earlier one that had the same pid
+        self.host = socket.gethostname()
+        self.owner = f'{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._handlers = {}
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._heartbeat_thread = None
+        self._heartbeat_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for name, kind in LATER_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {kind}')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind, handler):
+        """Run ``handler(payload, progress)`` for jobs of ``kind``; its return value is the job result"""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, payload, total=0):
+        """Store a job and hand it to a worker, returning its id straight away"""
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, payload, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, QUEUED, json.dumps(payload), total, now, now),
+            )
+            conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                         (DONE, FAILED, now - self.retention))
+        if self.workers <= 0:
+            if self._claim(job_id):
+                self._run(job_id)
+        else:
+            with self._wakeup:
+                self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """The job as a plain dict, or None if it is unknown (or already pruned)"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'done': row['done'],
+            'total': row['total'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def _claim(self, job_id):
+        # The status check makes the claim atomic even with several processes sharing the file
+        now = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute(
+                'UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ? WHERE id = ? AND status = ?',
+                (RUNNING, self.owner, now + self.lease, now, job_id, QUEUED),
+            ).rowcount == 1
+        if claimed:
+            self._start_heartbeat()
+        return claimed
+
+    def _start_heartbeat(self):
+        with self._heartbeat_lock:
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._renew_leases, daemon=True)
+                self._heartbeat_thread.start()
+
+    def _renew_leases(self):
+        """Keep extending the lease on every job this process is running"""
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                with self._connect() as conn:
+                    conn.execute('UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?',
+                                 (time.time() + self.lease, self.owner, RUNNING))
+            except sqlite3.Error as e:
+                print(f'Renewing job leases failed: {e}')
+
+    def _owner_gone(self, owner):
+        """True when ``owner`` is known to be dead: a process on this host that no longer exists
+
+        A pid equal to this process's own (pid 1 in a restarted container, say) proves nothing
+        either way, so that case is left to the lease.
+        """
+        host, _, rest = (owner or '').partition(':')
+        pid, _, _ = rest.partition(':')
+        if host != self.host or not pid.isdigit() or int(pid) == os.getpid():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            return False
+        return False
+
+    def requeue_abandoned(self):
+        """Queue again the running jobs whose owner died (lease lapsed, or a dead process on this host)"""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute('SELECT id, owner, lease_until FROM jobs WHERE status = ?', (RUNNING,)).fetchall()
+            # Rows claimed before leases existed have none and count as abandoned
+            abandoned = [(row['id'], row['owner']) for row in rows
+                         if row['lease_until'] is None or row['lease_until'] < now or self._owner_gone(row['owner'])]
+            requeued = 0
+            for job_id, owner in abandoned:
+                # Matching the owner too keeps a job that was renewed or finished meanwhile
+                requeued += conn.execute(
+                    'UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, updated_at = ? '
+                    'WHERE id = ? AND status = ? AND owner IS ?', (QUEUED, now, job_id, RUNNING, owner),
+                ).rowcount
+        return requeued
+
+    def _next(self):
+        """Claim the oldest queued job, or return None when there is nothing to do"""
+        while True:
+            with self._connect() as conn:
+                row = conn.execute('SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1',
+                                   (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            if self._claim(row['id']):
+                return row['id']
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                         (*fields.values(), job_id))
+
+    def _run(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT kind, payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        try:
+            result = self._handlers[row['kind']](json.loads(row['payload']),
+                                                 lambda done: self._update(job_id, done=done))
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e))
+            print(f"Job {job_id} ({row['kind']}) failed: {e}")
+        else:
+            self._update(job_id, status=DONE, result=json.dumps(result))
+
+    def _work(self):
+        while True:
+            job_id = self._next()
+            if job_id is None:
+                # Notified on enqueue; the timeout also picks up jobs queued by other processes
+                with self._wakeup:
+                    self._wakeup.wait(timeout=5)
+                continue
+            self._run(job_id)
+
+    def _watch(self):
+        # Another process sharing the file may die mid-job at any time, not only before a restart
+        while True:
+            time.sleep(self.lease)
+            try:
+                if self.requeue_abandoned():
+                    with self._wakeup:
+                        self._wakeup.notify_all()
+            except sqlite3.Error as e:
+                print(f'Requeueing abandoned jobs failed: {e}')
+
+    def start(self):
+        """Requeue jobs whose owner is gone and start the worker threads"""
+        if self.workers <= 0 or self._threads:
+            return
+        self.requeue_abandoned()
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        self._threads.append(watcher)
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
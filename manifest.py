@@ -0,0 +1,397 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from media import MediaItem, parse_timestamp
+
+
+# Bump whenever the media table changes; the manifest is a cache, so an old file is
+# simply dropped and refilled by the next reconcile.
+SCHEMA_VERSION = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    public_id TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    bytes INTEGER,
+    width INTEGER,
+    height INTEGER,
+    poster TEXT,
+    content_hash TEXT,
+    captured_at REAL,
+    original_filename TEXT,
+    -- dHash as a signed 64-bit integer, so the whole column loads straight into a NumPy array
+    perceptual_hash INTEGER,
+    -- Derived from captured_at (or created_at when unknown) so the gallery's filters are index lookups
+    taken_at REAL NOT NULL,
+    month TEXT NOT NULL,
+    month_day TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_taken_at ON media (taken_at DESC, public_id DESC);
+CREATE INDEX IF NOT EXISTS media_type_taken_at ON media (resource_type, taken_at DESC, public_id DESC);
+CREATE INDEX IF NOT EXISTS media_month ON media (month);
+CREATE INDEX IF NOT EXISTS media_month_day ON media (month_day, taken_at DESC, public_id DESC);
+CREATE INDEX IF NOT EXISTS media_content_hash ON media (content_hash);
+-- Tombstones: when each asset was removed, so a re-list that began earlier does not bring it back
+CREATE TABLE IF NOT EXISTS deleted (
+    public_id TEXT PRIMARY KEY,
+    deleted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ('public_id', 'format', 'resource_type', 'created_at', 'bytes', 'width', 'height', 'poster', 'content_hash',
+           'captured_at', 'original_filename', 'perceptual_hash', 'taken_at', 'month', 'month_day')
+
+# Listing columns a re-list from storage may lack but the upload that created the row recorded
+PRESERVED_COLUMNS = ('content_hash', 'captured_at', 'original_filename', 'perceptual_hash')
+
+ORDER = 'ORDER BY taken_at DESC, public_id DESC'
+
+# Tombstones outlive any re-list, including one another worker started earlier and is still running
+TOMBSTONE_SECONDS = 86400
+
+
+def encode_cursor(item):
+    """Opaque page cursor pointing just past ``item`` in (taken_at, public_id) order"""
+    raw = json.dumps([item.taken_at.timestamp(), item.public_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def hash_to_int(hex_hash):
+    """A 16 hex digit perceptual hash as the signed 64-bit integer SQLite can store"""
+    value = int(hex_hash, 16)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hash_to_hex(value):
+    return f'{value & (1 << 64) - 1:016x}'
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, public_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(timestamp, (int, float)) or not isinstance(public_id, str):
+        raise ValueError('Invalid cursor')
+    return timestamp, public_id
+
+
+class MediaManifest:
+    """Local SQLite copy of the media listing so page views never hit the Admin API"""
+
+    def __init__(self, path, ttl=900):
+        self.path = path
+        self.ttl = ttl
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript('DROP TABLE IF EXISTS media; DROP TABLE IF EXISTS deleted; DROP TABLE IF EXISTS meta;')
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(item):
+        return (item.public_id, item.format, item.resource_type, item.timestamp, item.bytes, item.width, item.height,
+                item.poster, item.content_hash, item.captured_at.timestamp() if item.captured_at else None,
+                item.display_name, hash_to_int(item.perceptual_hash) if item.perceptual_hash else None,
+                item.taken_at.timestamp(), item.month, item.taken_at.strftime('%m-%d'))
+
+    @staticmethod
+    def _item(row):
+        return MediaItem(row['public_id'], row['format'], row['resource_type'], row['created_at'],
+                         row['bytes'], row['width'], row['height'], row['poster'], row['content_hash'],
+                         row['captured_at'], row['original_filename'],
+                         hash_to_hex(row['perceptual_hash']) if row['perceptual_hash'] is not None else None)
+
+    @staticmethod
+    def _bump(conn):
+        """Advance the listing version; called in the same transaction as the change it marks"""
+        conn.execute("INSERT INTO meta (key, value) VALUES ('version', '1') "
+                     "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('modified_at', ?)", (str(time.time()),))
+
+    @staticmethod
+    def _fingerprint(conn):
+        digest = hashlib.blake2b(digest_size=16)
+        for row in conn.execute(f"SELECT {', '.join(COLUMNS)} FROM media ORDER BY public_id"):
+            digest.update(repr(tuple(row)).encode())
+        return digest.digest()
+
+    @staticmethod
+    def _keep_known(items, rows):
+        """Fill in what ``items`` lack from the PRESERVED_COLUMNS of their earlier ``rows``"""
+        known = {row['public_id']: row for row in rows}
+        for item in items:
+            row = known.get(item.public_id)
+            if row is None:
+                continue
+            item.content_hash = item.content_hash or row['content_hash']
+            item.original_filename = item.original_filename or row['original_filename']
+            if item.perceptual_hash is None and row['perceptual_hash'] is not None:
+                item.perceptual_hash = hash_to_hex(row['perceptual_hash'])
+            if item.captured_at is None and row['captured_at'] is not None:
+                item.captured_at = parse_timestamp(row['captured_at'])
+
+    def upsert(self, item):
+        """Record a single uploaded asset, keeping metadata an earlier record of it had"""
+        with self._write_lock, self._connect() as conn:
+            # A webhook for an asset uploaded through the app may carry less than the app recorded
+            self._keep_known([item], conn.execute(
+                f"SELECT public_id, {', '.join(PRESERVED_COLUMNS)} FROM media WHERE public_id = ?", (item.public_id,)))
+            conn.execute(
+                f"INSERT OR REPLACE INTO media ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                self._row(item),
+            )
+            # Uploaded again after a delete
+            conn.execute('DELETE FROM deleted WHERE public_id = ?', (item.public_id,))
+            self._bump(conn)
+
+    @staticmethod
+    def _bury(conn, public_ids):
+        """Record that ``public_ids`` are gone from storage as of now"""
+        deleted_at = time.time()
+        conn.executemany('INSERT OR REPLACE INTO deleted (public_id, deleted_at) VALUES (?, ?)',
+                         [(public_id, deleted_at) for public_id in public_ids])
+
+    def remove(self, public_id):
+        """Forget a deleted asset"""
+        with self._write_lock, self._connect() as conn:
+            self._bury(conn, [public_id])
+            if conn.execute('DELETE FROM media WHERE public_id = ?', (public_id,)).rowcount:
+                self._bump(conn)
+
+    def remove_many(self, public_ids):
+        """Forget a batch of deleted assets in one transaction"""
+        with self._write_lock, self._connect() as conn:
+            self._bury(conn, public_ids)
+            if conn.executemany('DELETE FROM media WHERE public_id = ?',
+                                [(public_id,) for public_id in public_ids]).rowcount:
+                self._bump(conn)
+
+    def rename(self, old_public_id, item):
+        """Move an asset to a new public_id, replacing the old row in one transaction"""
+        with self._write_lock, self._connect() as conn:
+            conn.execute('DELETE FROM media WHERE public_id = ?', (old_public_id,))
+            conn.execute(
+                f"INSERT OR REPLACE INTO media ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                self._row(item),
+            )
+            self._bury(conn, [old_public_id])
+            conn.execute('DELETE FROM deleted WHERE public_id = ?', (item.public_id,))
+            self._bump(conn)
+
+    def get(self, public_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM media WHERE public_id = ?', (public_id,)).fetchone()
+        return self._item(row) if row else None
+
+    def get_many(self, public_ids):
+        """{public_id: item} for those of ``public_ids`` the manifest has"""
+        public_ids = list(public_ids)
+        items = {}
+        with self._connect() as conn:
+            # Well under SQLite's limit on bound parameters
+            for start in range(0, len(public_ids), 500):
+                chunk = public_ids[start:start + 500]
+                rows = conn.execute(f"SELECT * FROM media WHERE public_id IN ({', '.join('?' * len(chunk))})", chunk)
+                items.update((row['public_id'], self._item(row)) for row in rows)
+        return items
+
+    def find_by_hash(self, content_hash):
+        """The stored asset with these exact bytes, if any"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM media WHERE content_hash = ? LIMIT 1', (content_hash,)).fetchone()
+        return self._item(row) if row else None
+
+    def all(self):
+        """Every asset, most recently taken first"""
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT * FROM media {ORDER}').fetchall()
+        return [self._item(row) for row in rows]
+
+    def page(self, cursor=None, limit=60, taken_from=None, taken_to=None, resource_type=None, query=None):
+        """One page of the listing, most recently taken first, plus the cursor for the next page
+
+        Pages are keyed on (taken_at, public_id) rather than offsets, so uploads and deletes
+        between requests never shift items across page boundaries. ``taken_from`` and
+        ``taken_to`` (unix times, the end exclusive) and ``resource_type`` narrow the listing
+        through the indexes; ``query`` matches a part of the original filename.
+        """
+        where, params = [], []
+        if cursor:
+            where.append('(taken_at, public_id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        if taken_from is not None:
+            where.append('taken_at >= ?')
+            params.append(taken_from)
+        if taken_to is not None:
+            where.append('taken_at < ?')
+            params.append(taken_to)
+        if resource_type:
+            where.append('resource_type = ?')
+            params.append(resource_type)
+        if query:
+            where.append("original_filename LIKE ? ESCAPE '\\'")
+            params.append('%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        # A substring match cannot use an index; one pass over the table and a sort of the matches
+        # beats walking the taken_at index with a row lookup per step when matches are rare
+        source = 'media NOT INDEXED' if query else 'media'
+        sql = f"SELECT * FROM {source} {'WHERE ' + ' AND '.join(where) if where else ''} {ORDER} LIMIT ?"
+        with self._connect() as conn:
+            rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+        items = [self._item(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def on_this_day(self, month_day, limit=None):
+        """Everything taken on ``month_day`` ('MM-DD') of any year, most recent first"""
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT * FROM media WHERE month_day = ? {ORDER} LIMIT ?',
+                                (month_day, -1 if limit is None else limit)).fetchall()
+        return [self._item(row) for row in rows]
+
+    def perceptual_hashes(self):
+        """(public_ids, signed 64-bit hashes) of every photo with a perceptual hash"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # Plain tuples: building a Row per photo would double the cost of loading a big library
+            cursor.row_factory = None
+            rows = cursor.execute('SELECT public_id, perceptual_hash FROM media '
+                                  'WHERE perceptual_hash IS NOT NULL').fetchall()
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    def months(self):
+        """[(month 'YYYY-MM', count)] of the whole library, newest first"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT month, COUNT(*) FROM media GROUP BY month ORDER BY month DESC').fetchall()
+        return [tuple(row) for row in rows]
+
+    def replace_all(self, items, listed_since=None):
+        """Swap the whole listing for a fresh one from storage in a single transaction
+
+        Rows created at or after ``listed_since`` (unix time the re-list started) are kept so
+        uploads that race with a reconcile do not vanish until the next one, and assets removed
+        since then are left out even if the listing still had them.
+        """
+        with self._write_lock, self._connect() as conn:
+            before = self._fingerprint(conn)
+            first_sync = conn.execute("SELECT 1 FROM meta WHERE key = 'synced_at'").fetchone() is None
+            # Listings without metadata (S3) keep what was recorded when the files were uploaded
+            self._keep_known(items, conn.execute(f"SELECT public_id, {', '.join(PRESERVED_COLUMNS)} FROM media"))
+            if listed_since:
+                gone = {row[0] for row in
+                        conn.execute('SELECT public_id FROM deleted WHERE deleted_at >= ?', (listed_since,))}
+                items = [item for item in items if item.public_id not in gone]
+                conn.execute('DELETE FROM media WHERE created_at < ?', (listed_since,))
+                conn.execute('DELETE FROM deleted WHERE deleted_at < ?', (listed_since - TOMBSTONE_SECONDS,))
+            else:
+                conn.execute('DELETE FROM media')
+                conn.execute('DELETE FROM deleted')
+            conn.executemany(
+                f"INSERT OR REPLACE INTO media ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [self._row(item) for item in items],
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)", (str(time.time()),))
+            # A periodic reconcile that finds nothing new must not invalidate every cached page
+            if first_sync or self._fingerprint(conn) != before:
+                self._bump(conn)
+
+    def synced_at(self):
+        """Unix time of the last full reconcile, or None if there never was one"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+        return float(row['value']) if row else None
+
+    def version(self):
+        """(version, modified_at) of the listing; the version moves on every upload, delete or
+        reconcile that changed something, and is 0 until the first reconcile"""
+        with self._connect() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('version', 'modified_at')").fetchall())
+        return int(meta.get('version', 0)), float(meta.get('modified_at', 0))
+
+    def is_stale(self):
+        synced_at = self.synced_at()
+        return synced_at is None or time.time() - synced_at > self.ttl
+
+
+class ManifestSync:
+    """Reconciles a manifest against storage, in the background and on demand"""
+
+    def __init__(self, manifest, fetch_items, interval=300):
+        self.manifest = manifest
+        self.fetch_items = fetch_items
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def reconcile(self, blocking=False):
+        """Re-list storage and replace the manifest; skipped if a reconcile is already running"""
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            listed_since = time.time()
+            self.manifest.replace_all(self.fetch_items(), listed_since=listed_since)
+            return True
+        finally:
+            self._lock.release()
+
+    def reconcile_async(self):
+        threading.Thread(target=self._safe_reconcile, daemon=True).start()
+
+    def _safe_reconcile(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f'Manifest reconcile failed: {e}')
+
+    def _run(self):
+        # The first page view syncs an empty manifest, so startup itself never waits on storage
+        while True:
+            time.sleep(self.interval)
+            self._safe_reconcile()
+
+    def start(self):
+        """Start the periodic reconcile thread (no-op when the interval is 0)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def ensure_fresh(self):
+        """Block on the very first sync, otherwise refresh stale listings in the background"""
+        if self.manifest.synced_at() is None:
+            # Wait for any reconcile already in flight, then list only if it did not fill the manifest
+            with self._lock:
+                pass
+            if self.manifest.synced_at() is None:
+                self.reconcile(blocking=True)
+        elif self.manifest.is_stale():
+            self.reconcile_async()
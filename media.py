@@ -0,0 +1,139 @@
+import re
+from datetime import datetime, timezone
+from operator import attrgetter
+
+
+VIDEO_FORMATS = {'mp4', 'mov', 'avi', 'mkv'}
+
+# Public ids of uploads through this app are '<uuid4 hex>_<secure filename>'
+UNIQUE_PREFIX = re.compile(r'^[0-9a-f]{32}_')
+
+
+def parse_exif_datetime(value):
+    """EXIF's 'YYYY:MM:DD HH:MM:SS' as an ISO string, or None"""
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_timestamp(value):
+    """Turn a Cloudinary ISO string, unix time or datetime into an aware UTC datetime"""
+    if value is None or value == '':
+        return datetime.fromtimestamp(0, timezone.utc)
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class MediaItem:
+    """Compact, typed record for one stored photo or video"""
+
+    __slots__ = ('public_id', 'format', 'resource_type', 'created_at', 'bytes', 'width', 'height', 'poster',
+                 'content_hash', 'captured_at', 'original_filename', 'perceptual_hash')
+
+    def __init__(self, public_id, format, resource_type='image', created_at=None, bytes=None, width=None, height=None,
+                 poster=None, content_hash=None, captured_at=None, original_filename=None, perceptual_hash=None):
+        self.public_id = public_id
+        self.format = format
+        self.resource_type = resource_type
+        self.created_at = parse_timestamp(created_at)
+        self.bytes = bytes
+        self.width = width
+        self.height = height
+        # Still image shown in place of a video until it is played
+        self.poster = poster
+        # SHA-256 of the original bytes, used to skip re-uploading the same file
+        self.content_hash = content_hash
+        # When the photo or video was taken (EXIF or container metadata), if known; wall-clock time kept as UTC
+        self.captured_at = parse_timestamp(captured_at) if captured_at else None
+        # Name of the file as uploaded, where storage kept it
+        self.original_filename = original_filename
+        # 64-bit dHash of a photo as 16 hex digits, for finding near-duplicates (see similarity.py)
+        self.perceptual_hash = perceptual_hash
+
+    @classmethod
+    def from_resource(cls, resource):
+        """Build a record from a Cloudinary resource, upload result or manifest row"""
+        context = (resource.get('context') or {}).get('custom') or {}
+        # Direct uploads ask Cloudinary for the embedded metadata instead
+        captured_at = resource.get('captured_at') or context.get('captured_at') or \
+            parse_exif_datetime((resource.get('image_metadata') or {}).get('DateTimeOriginal'))
+        original_filename = resource.get('original_filename') or context.get('original_filename')
+        if original_filename and resource.get('format') and '.' not in original_filename:
+            # Cloudinary reports the name without its extension
+            original_filename = f"{original_filename}.{resource['format']}"
+        return cls(
+            resource['public_id'],
+            resource.get('format') or '',
+            resource.get('resource_type') or 'image',
+            resource.get('created_at'),
+            resource.get('bytes'),
+            resource.get('width'),
+            resource.get('height'),
+            resource.get('poster'),
+            # Stored on the asset as context metadata, so a re-listing brings it back
+            resource.get('content_hash') or context.get('content_hash'),
+            captured_at,
+            original_filename,
+            resource.get('perceptual_hash') or context.get('perceptual_hash'),
+        )
+
+    @property
+    def filename(self):
+        return f'{self.public_id}.{self.format}' if self.format else self.public_id
+
+    @property
+    def display_name(self):
+        """The original filename, or the closest guess from the public_id"""
+        if self.original_filename:
+            return self.original_filename
+        name = UNIQUE_PREFIX.sub('', self.public_id.rsplit('/', 1)[-1])
+        return f'{name}.{self.format}' if self.format else name
+
+    @property
+    def is_video(self):
+        return self.resource_type == 'video' or self.format.lower() in VIDEO_FORMATS
+
+    @property
+    def timestamp(self):
+        """created_at as unix time, the form the manifest stores"""
+        return self.created_at.timestamp()
+
+    @property
+    def taken_at(self):
+        """Capture time when known, otherwise upload time: what the gallery sorts on"""
+        return self.captured_at or self.created_at
+
+    @property
+    def month(self):
+        """Timeline bucket, 'YYYY-MM'"""
+        return self.taken_at.strftime('%Y-%m')
+
+    def to_dict(self):
+        return {
+            'filename': self.filename,
+            'public_id': self.public_id,
+            'format': self.format,
+            'resource_type': self.resource_type,
+            'created_at': self.created_at.isoformat(),
+            'bytes': self.bytes,
+            'width': self.width,
+            'height': self.height,
+            'poster': self.poster,
+            'content_hash': self.content_hash,
+            'captured_at': self.captured_at.isoformat() if self.captured_at else None,
+            'original_filename': self.display_name,
+            'perceptual_hash': self.perceptual_hash,
+        }
+
+    def __repr__(self):
+        return f'MediaItem({self.filename!r}, created_at={self.created_at.isoformat()!r})'
+
+
+def sort_media(items):
+    """Most recently taken first, public_id breaking ties, in one O(n log n) pass"""
+    return sorted(items, key=attrgetter('taken_at', 'public_id'), reverse=True)
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow photos are uploaded exactly as received
+    Image = None
+
+
+# Extensions the stage knows how to re-encode, mapped to the Pillow format that writes them
+FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF'}
+
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL = 36867
+DATETIME = 306
+
+
+def capture_date(image):
+    """EXIF DateTimeOriginal (or DateTime) as an ISO string, or None"""
+    try:
+        exif = image.getexif()
+        value = exif.get_ifd(EXIF_IFD).get(DATETIME_ORIGINAL) or exif.get(DATETIME)
+        return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat() if value else None
+    except Exception:
+        return None
+
+
+def optimize_image(path, max_dimension=4096, quality=85):
+    """Recompress one photo in place and report what it saved
+
+    Applies the EXIF orientation, caps the longest side, drops metadata (keeping the ICC
+    profile) and re-encodes JPEGs at ``quality``. The original is kept whenever the result
+    would not be smaller. Animated GIFs are left alone. Runs in a worker process, so it
+    takes and returns only plain values.
+    """
+    original_bytes = os.path.getsize(path)
+    report = {'original_bytes': original_bytes, 'bytes': original_bytes, 'bytes_saved': 0, 'captured_at': None}
+    fmt = FORMATS.get(path.rsplit('.', 1)[-1].lower())
+    if Image is None or fmt is None:
+        return report
+
+    with Image.open(path) as image:
+        report['captured_at'] = capture_date(image)
+        if getattr(image, 'n_frames', 1) > 1:
+            return report
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        options = {'optimize': True}
+        if fmt == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            options.update(quality=quality, progressive=True)
+        if icc_profile and fmt != 'GIF':
+            options['icc_profile'] = icc_profile
+
+        tmp_path = f'{path}.optimized'
+        try:
+            image.save(tmp_path, fmt, **options)
+            optimized_bytes = os.path.getsize(tmp_path)
+            if optimized_bytes < original_bytes:
+                os.replace(tmp_path, path)
+                report.update(bytes=optimized_bytes, bytes_saved=original_bytes - optimized_bytes)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return report
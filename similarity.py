@@ -0,0 +1,242 @@
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:  # Searches fall back to plain Python, fine for a few thousand photos
+    np = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow photos are stored without a perceptual hash
+    Image = None
+
+
+HASH_BITS = 64
+# dHash compares neighbouring pixels of a 9x8 grayscale thumbnail: 8 comparisons x 8 rows
+HASH_SIZE = 8
+
+
+def dhash(image):
+    """64-bit difference hash of a Pillow image as 16 hex digits
+
+    Each bit says whether a pixel of a (HASH_SIZE + 1) x HASH_SIZE grayscale thumbnail is
+    brighter than its right-hand neighbour, so resizing, recompression and small edits
+    leave most bits alone while a different picture flips about half of them.
+    """
+    image = ImageOps.exif_transpose(image).convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + column
+            value = value << 1 | (pixels[offset] > pixels[offset + 1])
+    return f'{value:016x}'
+
+
+def dhash_file(file):
+    """dhash of an image file (path or file object), or None when Pillow is missing or cannot read it"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(file) as image:
+            # JPEGs decode at a fraction of full size; the hash only needs 9x8 pixels
+            image.draft('RGB', (64, 64))
+            return dhash(image)
+    except Exception:
+        return None
+
+
+def _blocks(threshold):
+    """Bit ranges splitting a hash into threshold + 1 blocks
+
+    Two hashes within ``threshold`` bits of each other differ in at most ``threshold``
+    blocks, so they agree exactly on at least one; comparing only hashes that share a block
+    finds every close pair without comparing every pair.
+    """
+    count = min(threshold + 1, HASH_BITS)
+    bounds = [HASH_BITS * i // count for i in range(count + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+class HashIndex:
+    """Near-duplicate search over a library's perceptual hashes
+
+    Hashes are kept packed in one uint64 array, so a search is a vectorized XOR and
+    popcount over the whole library: about a millisecond per 100k photos. add() and
+    discard() keep the index, and the groups once worked out, current as photos come and
+    go, so neither has to be rebuilt from scratch. Not thread-safe; callers hold a lock.
+    """
+
+    def __init__(self, keys, hashes):
+        """``keys`` identify the photos (public_ids); ``hashes`` are their dhashes as the signed
+        64-bit integers the manifest stores"""
+        self.keys = list(keys)
+        if np is not None:
+            self.hashes = np.array(hashes, dtype=np.int64).view(np.uint64)
+        else:
+            mask = (1 << HASH_BITS) - 1
+            self.hashes = [value & mask for value in hashes]
+        self._positions = {key: i for i, key in enumerate(self.keys)}
+        # (threshold, {key: shared set of the keys in its group}) once groups() has run
+        self._groups = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def add(self, key, hex_hash):
+        """Index one more photo (replacing any earlier hash under ``key``) and join it to the groups"""
+        self.discard(key)
+        if self._groups is not None:
+            threshold, group_of = self._groups
+            members = {key}
+            for match, _ in self.search(hex_hash, threshold):
+                members.update(group_of.get(match, (match,)))
+            if len(members) > 1:
+                for member in members:
+                    group_of[member] = members
+        value = int(hex_hash, 16)
+        self._positions[key] = len(self.keys)
+        self.keys.append(key)
+        if np is not None:
+            self.hashes = np.append(self.hashes, np.uint64(value))
+        else:
+            self.hashes.append(value)
+
+    def discard(self, key):
+        """Drop a photo from the index and its group, if it is there"""
+        i = self._positions.pop(key, None)
+        if i is None:
+            return
+        # The last entry takes the freed slot, so removal copies nothing
+        last = len(self.keys) - 1
+        if i != last:
+            self.keys[i] = self.keys[last]
+            self.hashes[i] = self.hashes[last]
+            self._positions[self.keys[i]] = i
+        self.keys.pop()
+        if np is not None:
+            self.hashes = self.hashes[:last]
+        else:
+            self.hashes.pop()
+        if self._groups is not None and key in self._groups[1]:
+            self._regroup(key)
+
+    def _regroup(self, removed):
+        """Split the group ``removed`` belonged to, if it held the others together"""
+        threshold, group_of = self._groups
+        members = group_of.pop(removed) - {removed}
+        for member in members:
+            del group_of[member]
+        rest = HashIndex.__new__(HashIndex)
+        rest.keys = list(members)
+        positions = [self._positions[member] for member in rest.keys]
+        rest.hashes = self.hashes[positions] if np is not None else [self.hashes[i] for i in positions]
+        rest._positions, rest._groups = {}, None
+        for group in rest.groups(threshold):
+            group = set(group)
+            for member in group:
+                group_of[member] = group
+
+    def distances(self, hex_hash):
+        """Hamming distance from ``hex_hash`` to every hash in the index"""
+        value = int(hex_hash, 16)
+        if np is None:
+            return [(value ^ other).bit_count() for other in self.hashes]
+        return popcount(self.hashes ^ np.uint64(value))
+
+    def search(self, hex_hash, threshold):
+        """[(key, distance)] of hashes within ``threshold`` bits, closest first"""
+        distances = self.distances(hex_hash)
+        if np is None:
+            matches = sorted((distance, i) for i, distance in enumerate(distances) if distance <= threshold)
+        else:
+            close = np.flatnonzero(distances <= threshold)
+            matches = sorted(zip(distances[close].tolist(), close.tolist()))
+        return [(self.keys[i], distance) for distance, i in matches]
+
+    def pairs(self, threshold):
+        """Every (i, j, distance) with i < j whose hashes are within ``threshold`` bits"""
+        if np is None:
+            return self._pairs_python(threshold)
+        found = set()
+        for start, end in _blocks(threshold):
+            block = (self.hashes >> np.uint64(HASH_BITS - end)) & np.uint64((1 << (end - start)) - 1)
+            order = np.argsort(block, kind='stable')
+            block = block[order]
+            # Walk each run of equal blocks by growing offsets; positions drop out as their run ends
+            positions = np.arange(len(order) - 1)
+            offset = 1
+            while positions.size:
+                positions = positions[block[positions] == block[positions + offset]]
+                first, second = order[positions], order[positions + offset]
+                distances = popcount(self.hashes[first] ^ self.hashes[second])
+                close = np.flatnonzero(distances <= threshold)
+                # A pair sharing several blocks turns up once per block
+                found.update(zip(np.minimum(first[close], second[close]).tolist(),
+                                 np.maximum(first[close], second[close]).tolist(), distances[close].tolist()))
+                positions = positions[positions + offset + 1 < len(order)]
+                offset += 1
+        return sorted(found)
+
+    def _pairs_python(self, threshold):
+        found = set()
+        for start, end in _blocks(threshold):
+            buckets = defaultdict(list)
+            mask = (1 << (end - start)) - 1
+            for i, value in enumerate(self.hashes):
+                buckets[(value >> (HASH_BITS - end)) & mask].append(i)
+            for members in buckets.values():
+                for n, i in enumerate(members):
+                    for j in members[n + 1:]:
+                        found.add((i, j))
+        pairs = ((i, j, (self.hashes[i] ^ self.hashes[j]).bit_count()) for i, j in sorted(found))
+        return [pair for pair in pairs if pair[2] <= threshold]
+
+    def groups(self, threshold):
+        """Clusters of keys linked by near-duplicate pairs, largest first
+
+        Worked out in full on the first call for a threshold; after that add() and discard()
+        keep them up to date.
+        """
+        if self._groups is None or self._groups[0] != threshold:
+            self._groups = (threshold, {})
+            for group in self._find_groups(threshold):
+                group = set(group)
+                for key in group:
+                    self._groups[1][key] = group
+        unique = {id(group): group for group in self._groups[1].values()}.values()
+        return sorted((sorted(group) for group in unique), key=len, reverse=True)
+
+    def _find_groups(self, threshold):
+        parent = {}
+
+        def root(i):
+            while parent.get(i, i) != i:
+                parent[i] = parent.get(parent[i], parent[i])
+                i = parent[i]
+            return i
+
+        linked = set()
+        for i, j, _ in self.pairs(threshold):
+            linked.update((i, j))
+            a, b = root(i), root(j)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+        clusters = defaultdict(list)
+        for i in sorted(linked):
+            clusters[root(i)].append(self.keys[i])
+        return sorted(clusters.values(), key=len, reverse=True)
+
+
+def popcount(values):
+    """Set bits of each uint64 in ``values``"""
+    if hasattr(np, 'bitwise_count'):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    bytes_ = values.view(np.uint8).reshape(-1, 8)
+    return _BYTE_POPCOUNT[bytes_].sum(axis=1, dtype=np.uint8)
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8) if np is not None else None
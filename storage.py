@@ -0,0 +1,194 @@
+import calendar
+import os
+import random
+import re
+import threading
+import time
+
+from metrics import TimedModule
+
+
+# Statuses worth another attempt: Cloudinary's 420 and the standard 429, and server errors
+RETRYABLE_STATUSES = {420, 429, 500, 502, 503, 504}
+
+
+class StorageUnavailable(Exception):
+    """Raised instead of calling storage while its circuit breaker is open"""
+
+
+def error_status(error):
+    """HTTP status of an SDK error, where the SDK exposes it (the Admin API puts it in the message)"""
+    match = re.match(r'Error (\d{3}) - ', str(error))
+    return int(match.group(1)) if match else None
+
+
+def is_retryable(error):
+    from cloudinary import exceptions
+    if isinstance(error, (exceptions.RateLimited, exceptions.GeneralError)):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    # The upload API raises a bare Error for socket failures and unmapped 5xx responses
+    return type(error) is exceptions.Error
+
+
+def is_rate_limited(error):
+    from cloudinary import exceptions
+    return isinstance(error, exceptions.RateLimited) or error_status(error) in (420, 429)
+
+
+class CircuitBreaker:
+    """Stops calls for a while after repeated failures or when told to (quota exhaustion)"""
+
+    def __init__(self, failure_threshold=5, cooldown=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return time.time() < self.open_until
+
+    def trip(self, until=None):
+        with self._lock:
+            self.open_until = max(self.open_until, until or time.time() + self.cooldown)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.failures = 0
+                self.open_until = time.time() + self.cooldown
+
+
+class StorageClient:
+    """The one way into Cloudinary: pooled connections, retries with jittered backoff,
+    Admin API quota tracking and a circuit breaker per API
+
+    ``client.api`` and ``client.uploader`` mirror the SDK modules of the same name, so
+    callers keep writing ``client.api.resources(...)``. The Admin API breaker opens when
+    X-FeatureRateLimit-Remaining drops to ``quota_floor`` and stays open until the quota
+    resets; callers then get StorageUnavailable at once and fall back to cached data.
+    """
+
+    def __init__(self, cloud_name, api_key, api_secret, pool_size=10, max_retries=3, backoff=0.5, max_backoff=8.0,
+                 quota_floor=25, on_call=None, on_retry=None):
+        import cloudinary
+        import cloudinary.api
+        import cloudinary.uploader
+        import cloudinary.utils
+
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+        # Also used for delivery downloads (exports), so those reuse the same connections
+        self.http = self._share_pool(cloudinary, pool_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.quota_floor = quota_floor
+        self.on_retry = on_retry
+        self.rate_limit_remaining = None
+        self.rate_limit_reset_at = None
+        self.breakers = {'api': CircuitBreaker(), 'uploader': CircuitBreaker()}
+
+        self.api = ResilientModule(self, 'api', TimedModule(cloudinary.api, 'api', on_call) if on_call else cloudinary.api)
+        self.uploader = ResilientModule(self, 'uploader', TimedModule(cloudinary.uploader, 'uploader', on_call)
+                                        if on_call else cloudinary.uploader)
+        # Local helpers: signing, URLs, configuration
+        self.utils = cloudinary.utils
+        self.config = cloudinary.config
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """A client configured from the CLOUDINARY_* and STORAGE_* environment variables"""
+        settings = {
+            'pool_size': int(os.getenv('STORAGE_POOL_SIZE', 10)),
+            'max_retries': int(os.getenv('STORAGE_MAX_RETRIES', 3)),
+            'backoff': float(os.getenv('STORAGE_BACKOFF', 0.5)),
+            'quota_floor': int(os.getenv('STORAGE_QUOTA_FLOOR', 25)),
+        }
+        settings.update(kwargs)
+        return cls(os.getenv('CLOUDINARY_CLOUD_NAME'), os.getenv('CLOUDINARY_API_KEY'),
+                   os.getenv('CLOUDINARY_API_SECRET'), **settings)
+
+    @staticmethod
+    def _share_pool(cloudinary, pool_size):
+        # The SDK builds one urllib3 manager per module at import time with a single kept-alive
+        # connection per host; concurrent uploads then open and drop a connection each time.
+        # One shared manager sized for the app's concurrency keeps them all alive.
+        import cloudinary.api_client.call_api as call_api
+        http = cloudinary.utils.get_http_connector(cloudinary.config(),
+                                                   dict(cloudinary.CERT_KWARGS, maxsize=pool_size))
+        call_api._http = http
+        cloudinary.uploader._http = http
+        return http
+
+    def delay(self, attempt):
+        """Full-jitter exponential backoff, so clients that failed together do not retry together"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, module, name, function, *args, **kwargs):
+        breaker = self.breakers[module]
+        if breaker.is_open:
+            raise StorageUnavailable(f'Storage {module} calls paused until {time.ctime(breaker.open_until)}')
+        # A file object is rewound before each retry so the whole file is sent again
+        file = args[0] if args and hasattr(args[0], 'seek') else None
+        position = file.tell() if file is not None else None
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_retries:
+                    if is_rate_limited(e):
+                        breaker.trip()
+                    else:
+                        breaker.record_failure()
+                    raise
+                if self.on_retry:
+                    self.on_retry(f'{module}.{name}', e)
+                time.sleep(self.delay(attempt))
+                if file is not None:
+                    file.seek(position)
+                continue
+            breaker.record_success()
+            if module == 'api':
+                self._track_quota(result)
+            return result
+
+    def _track_quota(self, result):
+        """Read the Admin API rate-limit headers the SDK exposes on its Response objects"""
+        remaining = getattr(result, 'rate_limit_remaining', None)
+        if remaining is None:
+            return
+        reset_at = getattr(result, 'rate_limit_reset_at', None)
+        self.rate_limit_remaining = remaining
+        self.rate_limit_reset_at = calendar.timegm(reset_at) if reset_at else None
+        if remaining <= self.quota_floor:
+            self.breakers['api'].trip(self.rate_limit_reset_at)
+
+
+class ResilientModule:
+    """SDK module proxy whose functions go through StorageClient.call"""
+
+    def __init__(self, client, name, module):
+        self._client = client
+        self._name = name
+        self._module = module
+
+    def __getattr__(self, name):
+        attribute = getattr(self._module, name)
+        if not callable(attribute) or isinstance(attribute, type):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._client.call(self._name, name, attribute, *args, **kwargs)
+        return call
@@ -1,26 +1,21 @@
 import os
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from storage import StorageClient
 
 # Load environment variables
 load_dotenv()
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+# Configure Cloudinary, with the app's retries and rate-limit handling
+storage = StorageClient.from_env()
 
 def test_cloudinary_connection():
     try:
         # Test API connection by listing resources
-        result = cloudinary.api.resources(type='upload', max_results=10)
+        result = storage.api.resources(type='upload', max_results=10)
         print(f"Cloudinary connection successful!")
         print(f"Cloud Name: {os.getenv('CLOUDINARY_CLOUD_NAME')}")
         print(f"Files in account: {len(result.get('resources', []))}")
+        print(f"Admin API calls left this hour: {storage.rate_limit_remaining}")
 
         if 'resources' in result:
             for resource in result['resources'][:5]:  # Show first 5
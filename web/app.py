@@ -1,10 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort
 import os
 import uuid
+import base64
+import io
+import json
+import mimetypes
+import time
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-from functools import wraps
+from functools import partial, wraps
 from dotenv import load_dotenv
+from media_index import UploadIndex
+from export import ExportEntry, archive_names, stream_zip
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow the gallery just shows the originals
+    Image = None
+
+try:
+    import av  # PyAV decodes frames in-process, no ffmpeg binary needed
+except ImportError:  # Video tiles then get a plain placeholder poster, which is never stored
+    av = None
 
 # Load environment variables
 load_dotenv()
@@ -18,10 +36,48 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi', 'mkv'}
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv'}
+
+# Sized copies of uploaded images: (width, height, crop to fill)
+DERIVATIVE_FOLDER = os.path.join('static', 'derivatives')
+RENDITIONS = {
+    'grid': (400, 400, True),
+    'grid_2x': (800, 800, True),
+    'lightbox': (1600, 1600, False),
+}
+# Grid renditions of a video are poster frames; the lightbox plays the original
+POSTER_RENDITIONS = ('grid', 'grid_2x')
+DERIVATIVE_FORMATS = ('webp', 'jpeg')
+DERIVATIVE_QUALITY = int(os.getenv('DERIVATIVE_QUALITY', 80))
+EAGER_DERIVATIVES = os.getenv('EAGER_DERIVATIVES', 'true').lower() in ('1', 'true', 'yes')
+
+# Uploads and renditions never change under their (UUID-prefixed) names, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 31536000
+# Let the front proxy send file bodies (and answer Range requests) instead of Python:
+# x-sendfile for Apache mod_xsendfile or lighttpd, x-accel-redirect for nginx. For nginx, map
+# MEDIA_ACCEL_PREFIX to this app's folder with an internal location, e.g.
+#   location /_protected/ { internal; alias /path/to/web/; }
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '').lower()
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/_protected').rstrip('/')
+
+if MEDIA_OFFLOAD not in ('', 'x-sendfile', 'x-accel-redirect'):
+    raise ValueError("MEDIA_OFFLOAD must be x-sendfile, x-accel-redirect or empty")
+
+# Files read ahead while an export streams
+EXPORT_PREFETCH = int(os.getenv('EXPORT_PREFETCH', 4))
+
+# Gallery pagination
+GALLERY_PAGE_SIZE = int(os.getenv('GALLERY_PAGE_SIZE', 60))
+MAX_PAGE_SIZE = 200
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Cached listing of the upload folder, saved next to the instance data so restarts skip the rescan
+UPLOAD_INDEX_PATH = os.getenv('UPLOAD_INDEX_PATH') or os.path.join(app.instance_path, 'upload_index.json')
+upload_index = UploadIndex(UPLOAD_FOLDER, UPLOAD_INDEX_PATH)
+
 # Password configuration from environment variables
 USERNAME = os.getenv('USERNAME')
 PASSWORD = os.getenv('PASSWORD')
@@ -44,12 +100,140 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def is_image(filename):
+    return filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+def is_video(filename):
+    return filename.rsplit('.', 1)[-1].lower() in VIDEO_EXTENSIONS
+
+def has_rendition(filename, rendition):
+    return is_image(filename) or (is_video(filename) and rendition in POSTER_RENDITIONS)
+
+def extract_video_frame(path):
+    """First keyframe of a video as a Pillow image, or None when PyAV is missing or cannot decode it"""
+    if av is None:
+        return None
+    try:
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            # Only keyframes are decoded, which is enough for a poster and far cheaper
+            stream.codec_context.skip_frame = 'NONKEY'
+            for frame in container.decode(stream):
+                return frame.to_image()
+    except Exception as e:
+        print(f'Could not read a frame from {path}: {e}')
+    return None
+
+def derivative_path(rendition, filename, fmt):
+    return os.path.join(DERIVATIVE_FOLDER, rendition, f'{filename}.{fmt}')
+
+def render(image, rendition, fmt, out):
+    """Size ``image`` for a rendition and save it to ``out`` (a path or file object)"""
+    width, height, crop = RENDITIONS[rendition]
+    image = ImageOps.exif_transpose(image)
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image.thumbnail((width, height), Image.LANCZOS)
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(out, format=fmt.upper(), quality=DERIVATIVE_QUALITY)
+
+def generate_derivative(filename, rendition, fmt):
+    """Render one sized copy of an uploaded image or video poster with Pillow
+
+    Returns its path, or None for a video no frame could be decoded from.
+    """
+    source = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    image = Image.open(source) if is_image(filename) else extract_video_frame(source)
+    if image is None:
+        return None
+    target = derivative_path(rendition, filename, fmt)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Write to a temp name first so a concurrent request never serves a half-written file
+    temp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+    with image:
+        render(image, rendition, fmt, temp_path)
+    os.replace(temp_path, target)
+    return target
+
+def placeholder_poster(rendition, fmt):
+    """A plain frame for a video without a decodable one; not stored or cached, so a real
+    poster takes its place as soon as one can be made (e.g. once PyAV is installed)"""
+    buffer = io.BytesIO()
+    render(Image.new('RGB', (1280, 720), '#2b2b2b'), rendition, fmt, buffer)
+    response = app.response_class(buffer.getvalue(), mimetype=f'image/{fmt}')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def generate_derivatives(filename):
+    """Eagerly render every rendition (or video poster) of a new upload"""
+    if Image is None:
+        return
+    for rendition in RENDITIONS:
+        if has_rendition(filename, rendition):
+            for fmt in DERIVATIVE_FORMATS:
+                generate_derivative(filename, rendition, fmt)
+
+def remove_derivatives(filename):
+    for rendition in RENDITIONS:
+        for fmt in DERIVATIVE_FORMATS:
+            path = derivative_path(rendition, filename, fmt)
+            if os.path.exists(path):
+                os.remove(path)
+
+def media_urls(filename):
+    """Original, grid, lightbox and download URLs for one upload"""
+    original = url_for('media', filename=filename)
+    urls = {'url': original, 'download_url': original}
+    for key, rendition in (('thumb_url', 'grid'), ('thumb_url_2x', 'grid_2x'), ('full_url', 'lightbox')):
+        urls[key] = url_for('derivative', rendition=rendition, filename=filename) \
+            if has_rendition(filename, rendition) else original
+    return urls
+
+def encode_cursor(mtime, filename):
+    """Opaque page cursor pointing just past (mtime, filename)"""
+    return base64.urlsafe_b64encode(json.dumps([mtime, filename]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        mtime, filename = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return float(mtime), str(filename)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def media_page(cursor=None, limit=GALLERY_PAGE_SIZE):
+    """One page of uploads keyed on (mtime, filename), plus the cursor for the next page"""
+    page, more = upload_index.page(decode_cursor(cursor) if cursor else None, limit=limit)
+    next_cursor = encode_cursor(*page[-1]) if more else None
+    return [name for _, name in page], next_cursor
+
+
 @app.route('/')
 @login_required
 def index():
     """Show upload form + gallery"""
-    files = sorted(os.listdir(app.config['UPLOAD_FOLDER']), key=lambda x: os.path.getmtime(os.path.join(app.config['UPLOAD_FOLDER'], x)), reverse=True)
-    return render_template('index.html', files=files)
+    files, next_cursor = media_page()
+    return render_template('index.html', files=files, next_cursor=next_cursor, media_urls=media_urls)
+
+
+@app.route('/api/media')
+@login_required
+def api_media():
+    """Cursor-paginated JSON listing of the gallery, most recent first"""
+    limit = min(max(request.args.get('limit', GALLERY_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        files, next_cursor = media_page(request.args.get('cursor') or None, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'items': [dict(media_urls(name),
+                       filename=name,
+                       resource_type='image' if is_image(name) else 'video',
+                       delete_url=url_for('delete_file', filename=name)) for name in files],
+        'next_cursor': next_cursor,
+    })
 
 
 @app.route('/upload', methods=['POST'])
@@ -74,6 +258,13 @@ def upload_file():
             unique_filename = f"{uuid.uuid4().hex}_{name}{ext}"
             save_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
             file.save(save_path)
+            upload_index.add(unique_filename)
+            if EAGER_DERIVATIVES:
+                try:
+                    generate_derivatives(unique_filename)
+                except Exception as e:
+                    # The derivative route renders missing renditions on first view
+                    print(f'Derivatives failed for {unique_filename}: {e}')
             uploaded_count += 1
 
     if uploaded_count > 0:
@@ -90,12 +281,105 @@ def delete_file(filename):
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     if os.path.exists(file_path):
         os.remove(file_path)
+        upload_index.discard(filename)
+        remove_derivatives(filename)
         flash(f'{filename} deleted successfully 🗑️')
     else:
         flash('File not found ❌')
     return redirect(url_for('index'))
 
 
+def send_immutable(path, mimetype=None):
+    """Serve a file that never changes under its name: strong ETag, Range support and a year of
+    private, immutable caching
+
+    With MEDIA_OFFLOAD the proxy sends the bytes and handles Range; the app only answers
+    revalidations with 304.
+    """
+    stat = os.stat(path)
+    # Strong, so If-Range lets a browser resume a video from where it stopped
+    etag = f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+    if MEDIA_OFFLOAD:
+        response = app.response_class(mimetype=mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        if MEDIA_OFFLOAD == 'x-sendfile':
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        else:
+            relative = os.path.relpath(os.path.abspath(path), app.root_path).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = f'{MEDIA_ACCEL_PREFIX}/{quote(relative)}'
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        response = response.make_conditional(request)
+    else:
+        response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=etag,
+                             max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = False
+    response.cache_control.no_cache = None
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/media/<filename>')
+@login_required
+def media(filename):
+    """Serve an original upload, with byte ranges so videos can seek"""
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if secure_filename(filename) != filename or not os.path.isfile(path):
+        abort(404)
+    return send_immutable(path)
+
+
+@app.route('/export', methods=['GET', 'POST'])
+@login_required
+def export():
+    """Stream a ZIP of the POSTed filename fields or, on GET, of every upload, written while it downloads"""
+    folder = app.config['UPLOAD_FOLDER']
+    if request.method == 'POST':
+        filenames = [name for name in dict.fromkeys(request.form.getlist('filename'))
+                     if secure_filename(name) == name and os.path.isfile(os.path.join(folder, name))]
+        entries = [(os.path.getmtime(os.path.join(folder, name)), name) for name in filenames]
+    else:
+        entries = upload_index.all()
+    if not entries:
+        flash('Nothing to download ⚠️')
+        return redirect(url_for('index'))
+
+    names = archive_names(name for _, name in entries)
+    # ZIP timestamps cannot predate 1980
+    archive = [ExportEntry(archive_name, partial(open, os.path.join(folder, name), 'rb'),
+                           max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+               for (mtime, name), archive_name in zip(entries, names)]
+    response = app.response_class(stream_zip(archive, prefetch=EXPORT_PREFETCH), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="memories-{time.strftime("%Y-%m-%d")}.zip"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Tell nginx to pass the stream through rather than buffer it
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/derivative/<rendition>/<filename>')
+@login_required
+def derivative(rendition, filename):
+    """Serve a sized image or video poster as WebP or JPEG depending on what the browser accepts"""
+    source = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if rendition not in RENDITIONS or secure_filename(filename) != filename or not os.path.exists(source):
+        abort(404)
+    if Image is None or not has_rendition(filename, rendition):
+        return redirect(url_for('media', filename=filename))
+
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    path = derivative_path(rendition, filename, fmt)
+    if not os.path.exists(path):
+        try:
+            path = generate_derivative(filename, rendition, fmt)
+        except Exception:
+            return redirect(url_for('media', filename=filename))
+    response = send_immutable(path, mimetype=f'image/{fmt}') if path else placeholder_poster(rendition, fmt)
+    response.vary.add('Accept')
+    return response
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Handle login"""
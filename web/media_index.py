@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+
+# A directory modified this recently may still change within the same mtime tick (coarse
+# timestamps on network filesystems), so a scan that close to it is repeated next time
+MTIME_SETTLE_SECONDS = 2
+
+
+class UploadIndex:
+    """In-memory (mtime, filename) index of the upload folder
+
+    A page view costs one stat of the folder: only when the folder's mtime has moved is it
+    scanned again, and then only names not seen before are stat'ed. Upload names are unique
+    and files are never rewritten, so a known entry never needs a second look. The index is
+    saved to ``sidecar_path`` so a restart picks up where it left off instead of rescanning.
+    """
+
+    def __init__(self, folder, sidecar_path=None):
+        self.folder = folder
+        self.sidecar_path = sidecar_path
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        # Ascending (mtime, filename), so pages are bisected rather than filtered
+        self._sorted = []
+        self._dir_mtime_ns = None
+        self._load()
+
+    def _load(self):
+        if not self.sidecar_path:
+            return
+        try:
+            with open(self.sidecar_path) as f:
+                saved = json.load(f)
+            if saved.get('folder') != os.path.abspath(self.folder):
+                return
+            self._mtimes = {name: mtime for name, mtime in saved['entries']}
+            self._dir_mtime_ns = saved['dir_mtime_ns']
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        self._sorted = sorted((mtime, name) for name, mtime in self._mtimes.items())
+
+    def _save(self):
+        if not self.sidecar_path:
+            return
+        temp_path = f'{self.sidecar_path}.{uuid.uuid4().hex}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.sidecar_path) or '.', exist_ok=True)
+            with open(temp_path, 'w') as f:
+                json.dump({'folder': os.path.abspath(self.folder), 'dir_mtime_ns': self._dir_mtime_ns,
+                           'entries': list(self._mtimes.items())}, f)
+            os.replace(temp_path, self.sidecar_path)
+        except OSError as e:
+            # The index still works from memory; the next start just scans again
+            print(f'Could not save the upload index: {e}')
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def refresh(self):
+        """Bring the index up to date if the folder changed since the last scan"""
+        with self._lock:
+            scan_started = time.time()
+            dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+            if dir_mtime_ns == self._dir_mtime_ns:
+                return
+
+            known = self._mtimes
+            current = {}
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.name in known:
+                        current[entry.name] = known[entry.name]
+                        continue
+                    try:
+                        if entry.is_file():
+                            current[entry.name] = entry.stat().st_mtime
+                    except FileNotFoundError:  # Deleted during the scan
+                        continue
+
+            if current.keys() != known.keys():
+                self._mtimes = current
+                self._sorted = sorted((mtime, name) for name, mtime in current.items())
+            settled = scan_started - dir_mtime_ns / 1e9 > MTIME_SETTLE_SECONDS
+            self._dir_mtime_ns = dir_mtime_ns if settled else None
+            self._save()
+
+    def add(self, filename):
+        """Record a file this process just wrote, without waiting for a rescan"""
+        mtime = os.path.getmtime(os.path.join(self.folder, filename))
+        with self._lock:
+            if filename not in self._mtimes:
+                self._mtimes[filename] = mtime
+                insort(self._sorted, (mtime, filename))
+
+    def discard(self, filename):
+        with self._lock:
+            mtime = self._mtimes.pop(filename, None)
+            if mtime is not None:
+                i = bisect_left(self._sorted, (mtime, filename))
+                if i < len(self._sorted) and self._sorted[i] == (mtime, filename):
+                    del self._sorted[i]
+
+    def page(self, after=None, limit=60):
+        """Up to ``limit`` (mtime, filename) entries older than ``after``, newest first, and
+        whether more follow"""
+        self.refresh()
+        with self._lock:
+            end = bisect_left(self._sorted, after) if after else len(self._sorted)
+            start = max(0, end - limit)
+            return self._sorted[start:end][::-1], start > 0
+
+    def all(self):
+        """Every (mtime, filename) entry, newest first, after bringing the index up to date"""
+        self.refresh()
+        with self._lock:
+            return self._sorted[::-1]
+
+    def __len__(self):
+        return len(self._mtimes)
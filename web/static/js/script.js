@@ -21,33 +21,389 @@ document.addEventListener('DOMContentLoaded', function() {
     const downloadBtn = lightbox.querySelector('.download-btn');
     const closeBtn = lightbox.querySelector('.close-lightbox');
 
-    // Add click handlers to all media items
-    document.querySelectorAll('.media-item').forEach(item => {
-        const mediaElement = item.querySelector('img, video, .video-container');
-        if (mediaElement) {
-            mediaElement.addEventListener('click', (e) => {
+    const gallery = document.querySelector('.gallery');
+    const sentinel = document.querySelector('.gallery-sentinel');
+
+    // One delegated click handler covers server-rendered and scroll-loaded items alike
+    if (gallery) {
+        gallery.addEventListener('click', (e) => {
+            // In selection mode a click anywhere on a tile toggles it instead of opening the lightbox
+            const tile = e.target.closest('.media-item');
+            if (selecting && tile && !e.target.closest('.delete-form')) {
+                e.preventDefault();
+                tile.classList.toggle('selected');
+                updateSelection();
+                return;
+            }
+            // Video tiles are a poster <img> inside .video-container, so look for the container first
+            const mediaElement = e.target.closest('.media-item .video-container') || e.target.closest('.media-item img');
+            if (mediaElement) {
                 e.preventDefault(); // Prevent default video play
                 openLightbox(mediaElement);
+            }
+        });
+    }
+
+    // Build a gallery tile with the same markup as templates/index.html
+    function createMediaItem(item) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'media-item';
+        wrapper.dataset.filename = item.filename;
+        wrapper.dataset.publicId = item.public_id;
+        if (item.full_url) wrapper.dataset.full = item.full_url;
+        if (item.download_url) wrapper.dataset.download = item.download_url;
+
+        if (item.resource_type === 'video') {
+            // Only the poster frame loads here; the video itself streams once the lightbox opens
+            const container = document.createElement('div');
+            container.className = 'video-container';
+            const poster = document.createElement('img');
+            poster.src = item.thumb_url || item.poster;
+            if (item.thumb_url_2x) poster.srcset = `${item.thumb_url} 1x, ${item.thumb_url_2x} 2x`;
+            poster.alt = item.filename;
+            poster.loading = 'lazy';
+            poster.decoding = 'async';
+            container.appendChild(poster);
+            container.insertAdjacentHTML('beforeend', '<div class="play-overlay"><div class="play-circle">PLAY</div></div>');
+            wrapper.appendChild(container);
+        } else {
+            const img = document.createElement('img');
+            img.src = item.thumb_url || item.url;
+            if (item.thumb_url_2x) img.srcset = `${item.thumb_url} 1x, ${item.thumb_url_2x} 2x`;
+            img.alt = item.filename;
+            img.loading = 'lazy';
+            img.decoding = 'async';
+            wrapper.appendChild(img);
+        }
+
+        const form = document.createElement('form');
+        form.action = item.delete_url;
+        form.method = 'POST';
+        form.className = 'delete-form';
+        form.innerHTML = '<button type="submit" class="delete-btn">🗑️ Delete</button>';
+        wrapper.appendChild(form);
+        return wrapper;
+    }
+
+    // Upload batches in the background and show a per-file summary instead of reloading the page
+    const uploadForm = document.querySelector('.upload-form');
+    const flashMessages = document.querySelector('.flash-messages');
+
+    function showMessages(messages) {
+        if (!flashMessages) return;
+        flashMessages.innerHTML = '';
+        messages.forEach(message => {
+            const p = document.createElement('p');
+            p.textContent = message;
+            flashMessages.appendChild(p);
+        });
+        flashMessages.hidden = messages.length === 0;
+    }
+
+    async function postJSON(url, payload) {
+        const response = await fetch(url, {
+            method: 'POST',
+            body: JSON.stringify(payload),
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+            credentials: 'same-origin'
+        });
+        return response.json();
+    }
+
+    // Uploads and deletes through the app are background jobs; poll until one finishes
+    async function waitForJob(job) {
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const response = await fetch(job.status_url, { credentials: 'same-origin' });
+            job = await response.json();
+            if (!response.ok) throw new Error(job.error || `HTTP ${response.status}`);
+        }
+        if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+        return job.result;
+    }
+
+    // Send one file to Cloudinary with signed params, in chunks when it is large
+    async function sendToCloudinary(file, params) {
+        const chunkSize = Number(uploadForm.dataset.chunkSize) || file.size;
+        const uploadId = `${params.public_id}-${Date.now()}`;
+        let result = null;
+        for (let start = 0; start < file.size || start === 0; start += chunkSize) {
+            const end = Math.min(start + chunkSize, file.size);
+            const formData = new FormData();
+            Object.entries(params.fields).forEach(([key, value]) => formData.append(key, value));
+            formData.append('file', file.slice(start, end), file.name);
+            const headers = {};
+            if (file.size > chunkSize) {
+                headers['X-Unique-Upload-Id'] = uploadId;
+                headers['Content-Range'] = `bytes ${start}-${end - 1}/${file.size}`;
+            }
+            const response = await fetch(params.upload_url, { method: 'POST', body: formData, headers });
+            result = await response.json();
+            if (!response.ok) throw new Error((result.error && result.error.message) || `HTTP ${response.status}`);
+            if (end >= file.size) break;
+        }
+        return result;
+    }
+
+    // SHA-256 of a file so the app can spot bytes it already has; null when too big or unsupported
+    async function hashFile(file) {
+        const limit = Number(uploadForm.dataset.hashLimit) || 0;
+        if (file.size > limit || !(window.crypto && window.crypto.subtle)) return null;
+        const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    function summarize(results) {
+        const duplicates = results.filter(result => result.duplicate).length;
+        const uploaded = results.filter(result => result.ok).length - duplicates;
+        const bytesSaved = results.reduce((total, result) => total + (result.bytes_saved || 0), 0);
+        const similar = results.filter(result => result.similar_to && result.similar_to.length).length;
+        return { uploaded, duplicates, failed: results.length - uploaded - duplicates, bytesSaved, similar, results };
+    }
+
+    // Browser -> Cloudinary directly; the app only signs the request and records the result
+    async function uploadDirect(files) {
+        // One file at a time, since each is read into memory whole to be hashed
+        const hashes = [];
+        for (const file of files) hashes.push(await hashFile(file));
+        const signed = await postJSON(uploadForm.dataset.signatureUrl, { filenames: files.map(file => file.name), hashes });
+        if (!signed.uploads) throw new Error(signed.error || 'Could not sign upload');
+        const results = await Promise.all(files.map(async (file, i) => {
+            const params = signed.uploads[i];
+            if (params.error) return { filename: file.name, ok: false, error: params.error };
+            if (params.duplicate) return params;
+            try {
+                const result = await sendToCloudinary(file, params);
+                return await postJSON(uploadForm.dataset.completeUrl, Object.assign(result, { filename: file.name }));
+            } catch (err) {
+                return { filename: file.name, ok: false, error: err.message };
+            }
+        }));
+        return summarize(results);
+    }
+
+    // Browser -> app -> Cloudinary; big videos go one by one as raw bodies so the server can stream them
+    async function uploadThroughServer(files, threshold) {
+        const small = files.filter(file => file.size <= threshold);
+        const large = files.filter(file => file.size > threshold);
+        const requests = large.map(file => fetch(uploadForm.dataset.streamUrl, {
+            method: 'POST',
+            body: file,
+            headers: { 'Accept': 'application/json', 'X-Filename': encodeURIComponent(file.name) },
+            credentials: 'same-origin'
+        }));
+        if (small.length) {
+            const formData = new FormData();
+            small.forEach(file => formData.append('file', file));
+            requests.push(fetch(uploadForm.action, {
+                method: 'POST',
+                body: formData,
+                headers: { 'Accept': 'application/json' },
+                credentials: 'same-origin'
+            }));
+        }
+
+        // Each response is a queued job, plus files the app settled at once (duplicates, wrong types)
+        const parts = await Promise.all((await Promise.all(requests)).map(async response => {
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.error || `HTTP ${response.status}`);
+            if (!job.id) return job.results;
+            return [...(await waitForJob(job)).results, ...(job.settled || [])];
+        }));
+        return summarize(parts.flat());
+    }
+
+    if (uploadForm) {
+        uploadForm.addEventListener('submit', async (e) => {
+            e.preventDefault();
+            const button = uploadForm.querySelector('button[type="submit"]');
+            const fileInput = uploadForm.querySelector('input[type="file"]');
+            const files = Array.from(fileInput.files);
+            const threshold = Number(uploadForm.dataset.largeThreshold) || Infinity;
+            button.disabled = true;
+            showMessages([`Uploading ${files.length} file(s)... ⏳`]);
+            try {
+                const summary = uploadForm.dataset.signatureUrl ?
+                    await uploadDirect(files) :
+                    await uploadThroughServer(files, threshold);
+
+                const messages = [];
+                if (summary.uploaded > 0) {
+                    const saved = summary.bytesSaved ? ` (${(summary.bytesSaved / 1024 ** 2).toFixed(1)} MB saved by recompression)` : '';
+                    messages.push(`${summary.uploaded} file(s) uploaded successfully 💖${saved}`);
+                }
+                if (summary.duplicates > 0) messages.push(`${summary.duplicates} file(s) already saved 💾`);
+                if (summary.similar > 0) messages.push(`${summary.similar} photo(s) look a lot like ones already saved, see Duplicates 👯`);
+                summary.results.filter(result => !result.ok).forEach(result => {
+                    messages.push(`Upload failed for ${result.filename}: ${result.error} ❌`);
+                });
+                showMessages(messages);
+
+                // New uploads are the most recent, so they go first in the gallery
+                const fragment = document.createDocumentFragment();
+                summary.results.filter(result => result.ok && !result.duplicate).forEach(result => {
+                    fragment.appendChild(createMediaItem(result.item));
+                });
+                if (gallery) gallery.prepend(fragment);
+                uploadForm.reset();
+            } catch (err) {
+                showMessages([`Upload failed: ${err.message} ❌`]);
+            } finally {
+                button.disabled = false;
+            }
+        });
+    }
+
+    // Selection mode: pick several tiles and delete or download them in one request
+    const toolbar = document.querySelector('.gallery-toolbar');
+    const selectToggle = toolbar && toolbar.querySelector('.select-toggle');
+    const bulkDeleteBtn = toolbar && toolbar.querySelector('.bulk-delete-btn');
+    const exportSelectedBtn = toolbar && toolbar.querySelector('.export-selected-btn');
+    let selecting = false;
+
+    function selectedTiles() {
+        return gallery ? Array.from(gallery.querySelectorAll('.media-item.selected')) : [];
+    }
+
+    function updateSelection() {
+        const count = selectedTiles().length;
+        [bulkDeleteBtn, exportSelectedBtn].filter(Boolean).forEach(button => {
+            button.querySelector('.selected-count').textContent = count;
+            button.hidden = !selecting || count === 0;
+        });
+    }
+
+    if (toolbar && gallery) {
+        selectToggle.addEventListener('click', () => {
+            selecting = !selecting;
+            gallery.classList.toggle('selecting', selecting);
+            selectToggle.textContent = selecting ? 'Cancel' : 'Select';
+            if (!selecting) selectedTiles().forEach(tile => tile.classList.remove('selected'));
+            updateSelection();
+        });
+
+        // A plain form post, so the browser streams the ZIP straight to a download
+        if (exportSelectedBtn) exportSelectedBtn.addEventListener('click', () => {
+            const tiles = selectedTiles();
+            if (!tiles.length) return;
+            const form = document.createElement('form');
+            form.method = 'POST';
+            form.action = toolbar.dataset.exportUrl;
+            tiles.forEach(tile => {
+                const input = document.createElement('input');
+                input.type = 'hidden';
+                input.name = 'public_id';
+                input.value = tile.dataset.publicId;
+                form.appendChild(input);
             });
+            document.body.appendChild(form);
+            form.submit();
+            form.remove();
+        });
+
+        bulkDeleteBtn.addEventListener('click', async () => {
+            const tiles = selectedTiles();
+            if (!tiles.length || !confirm(`Delete ${tiles.length} file(s)?`)) return;
+            bulkDeleteBtn.disabled = true;
+            try {
+                const job = await postJSON(toolbar.dataset.bulkDeleteUrl, {
+                    public_ids: tiles.map(tile => tile.dataset.publicId)
+                });
+                if (!job.id) throw new Error(job.error || 'Delete failed');
+                const summary = await waitForJob(job);
+                const deleted = new Set(summary.results.filter(result => result.ok).map(result => result.public_id));
+                tiles.filter(tile => deleted.has(tile.dataset.publicId)).forEach(tile => tile.remove());
+                const messages = [];
+                if (summary.deleted > 0) messages.push(`${summary.deleted} file(s) deleted successfully 🗑️`);
+                if (summary.failed > 0) messages.push(`Failed to delete ${summary.failed} file(s) ❌`);
+                showMessages(messages);
+            } catch (err) {
+                showMessages([`Delete failed: ${err.message} ❌`]);
+            } finally {
+                bulkDeleteBtn.disabled = false;
+                updateSelection();
+            }
+        });
+    }
+
+    // Single deletes go through fetch so the page (and its scroll position) stays put;
+    // only apps that render the selection toolbar answer deletes with JSON
+    if (toolbar && gallery) {
+        gallery.addEventListener('submit', async (e) => {
+            const form = e.target.closest('.delete-form');
+            if (!form) return;
+            e.preventDefault();
+            const tile = form.closest('.media-item');
+            try {
+                const response = await fetch(form.action, {
+                    method: 'POST',
+                    headers: { 'Accept': 'application/json' },
+                    credentials: 'same-origin'
+                });
+                const job = await response.json();
+                if (!response.ok) throw new Error(job.error || `HTTP ${response.status}`);
+                const result = (await waitForJob(job)).results[0];
+                if (!result.ok) throw new Error(result.error);
+                tile.remove();
+                showMessages([`${tile.dataset.filename} deleted successfully 🗑️`]);
+            } catch (err) {
+                showMessages([`Delete failed: ${err.message} ❌`]);
+            }
+        });
+    }
+
+    // Fetch the next page of the gallery whenever the sentinel scrolls into view
+    let loadingPage = false;
+    async function loadNextPage() {
+        const cursor = gallery.dataset.nextCursor;
+        if (loadingPage || !cursor) return;
+        loadingPage = true;
+        try {
+            const url = new URL(gallery.dataset.apiUrl, window.location.origin);
+            url.searchParams.set('cursor', cursor);
+            const response = await fetch(url, { credentials: 'same-origin' });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const page = await response.json();
+            const fragment = document.createDocumentFragment();
+            page.items.forEach(item => fragment.appendChild(createMediaItem(item)));
+            gallery.appendChild(fragment);
+            gallery.dataset.nextCursor = page.next_cursor || '';
+        } catch (err) {
+            console.error('Failed to load more memories', err);
+            return;
+        } finally {
+            loadingPage = false;
         }
-    });
+        if (!gallery.dataset.nextCursor) {
+            observer.disconnect();
+        } else if (sentinel.getBoundingClientRect().top < window.innerHeight + 800) {
+            // The observer only fires on changes, so keep filling a tall viewport ourselves
+            loadNextPage();
+        }
+    }
+
+    const observer = new IntersectionObserver((entries) => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+    }, { rootMargin: '800px 0px' });
+    if (gallery && sentinel && gallery.dataset.nextCursor) observer.observe(sentinel);
 
     // Open lightbox
     function openLightbox(mediaElement) {
+        const item = mediaElement.closest('.media-item');
         const isVideo = mediaElement.tagName.toLowerCase() === 'video' || mediaElement.classList.contains('video-container');
+        const originalSrc = isVideo ? item.dataset.full : mediaElement.src;
+        // Tiles carry a lightbox-sized rendition and the original download; the grid only has thumbnails
+        const fullSrc = item.dataset.full || originalSrc;
         let lightboxMedia;
 
         if (isVideo) {
             lightboxMedia = document.createElement('video');
-            const videoSrc = mediaElement.tagName.toLowerCase() === 'video' ?
-                mediaElement.querySelector('source').src :
-                mediaElement.querySelector('video source').src;
-            lightboxMedia.src = videoSrc;
+            lightboxMedia.src = fullSrc;
             lightboxMedia.controls = true;
             lightboxMedia.autoplay = true;
         } else {
             lightboxMedia = document.createElement('img');
-            lightboxMedia.src = mediaElement.src;
+            lightboxMedia.src = fullSrc;
         }
 
         // Clear previous content and add new media
@@ -55,13 +411,8 @@ document.addEventListener('DOMContentLoaded', function() {
         mediaContainer.appendChild(lightboxMedia);
 
         // Update download button
-        const downloadSrc = isVideo ?
-            (mediaElement.tagName.toLowerCase() === 'video' ?
-                mediaElement.querySelector('source').src :
-                mediaElement.querySelector('video source').src) :
-            mediaElement.src;
-        downloadBtn.href = downloadSrc;
-        downloadBtn.download = downloadBtn.href.split('/').pop();
+        downloadBtn.href = item.dataset.download || originalSrc;
+        downloadBtn.download = item.dataset.filename || downloadBtn.href.split('/').pop();
 
         // Show lightbox
         lightbox.classList.add('active');